@@ -4,8 +4,10 @@ from pathlib import Path
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = '-p&pw48y)y@ozdx$!dd7e+7sy!ji#bzfv7ch1u!)6&x111r3xz'
-DEBUG = True
-ALLOWED_HOSTS = ['127.0.0.1', 'localhost', 'wdp-project.onrender.com']
+# Activé par défaut en local ; DJANGO_DEBUG=false en production (render.yaml) pour servir
+# les fichiers statiques hachés avec un cache long
+DEBUG = os.environ.get('DJANGO_DEBUG', 'true').lower() in ('1', 'true', 'oui')
+ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS', '127.0.0.1,localhost,wdp-project.onrender.com').split(',')
 
 INSTALLED_APPS = [
     'django.contrib.admin',
@@ -19,6 +21,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Fichiers statiques hachés et précompressés (gzip/brotli), sans CDN
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -28,6 +32,7 @@ MIDDLEWARE = [
 ]
 
 ROOT_URLCONF = 'config.urls'
+WSGI_APPLICATION = 'config.wsgi.application'
 
 TEMPLATES = [
     {
@@ -48,7 +53,8 @@ TEMPLATES = [
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        # Surchargeable (ex. base jetable de la commande test_charge)
+        'NAME': os.environ.get('WDP_DATABASE_PATH', BASE_DIR / 'db.sqlite3'),
     }
 }
 
@@ -59,11 +65,51 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
+STATIC_ROOT = Path(os.environ.get('WDP_STATIC_ROOT', BASE_DIR / 'staticfiles'))
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = BASE_DIR / 'media'
+MEDIA_ROOT = Path(os.environ.get('WDP_MEDIA_ROOT', BASE_DIR / 'media'))
+# Durée de cache navigateur des médias, revalidés ensuite par ETag / Last-Modified
+MEDIA_CACHE_MAX_AGE = 24 * 60 * 60
+
+STORAGES = {
+    # Médias rangés par empreinte SHA-256 (poubelles/ab/cd/<sha256>.jpg), dédupliqués
+    'default': {
+        'BACKEND': 'interface.stockage.StockageAdresseContenu',
+    },
+    # Noms hachés (manifest) + versions .gz et .br générées au collectstatic
+    'staticfiles': {
+        'BACKEND': 'interface.stockage.StockageStatiqueCompresse',
+    },
+}
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Taille maximale des fichiers uploadés (10MB)
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024
+
+# Taille maximale d'un lot pour /api/classifier/
+CLASSIFICATION_LOT_MAX_IMAGES = 32
+CLASSIFICATION_LOT_MAX_VECTEURS = 1000
+
+# Artefacts dérivés (histogrammes, contours) :
+# 'immediat' les génère à chaque enregistrement, 'paresseux' à la première consultation.
+ARTEFACTS_MODE = 'paresseux'
+ARTEFACTS_CACHE_DIR = MEDIA_ROOT / 'cache_artefacts'
+ARTEFACTS_CACHE_TAILLE_MAX = 500 * 1024 * 1024  # 500MB
+
+# Erreurs des requêtes (tracebacks des 500, dont « database is locked ») sur stderr,
+# que DEBUG soit actif ou non : visibles dans les journaux de gunicorn et lues par test_charge
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'erreurs': {'format': '{levelname} {asctime} {name} {message}', 'style': '{'},
+    },
+    'handlers': {
+        'stderr': {'class': 'logging.StreamHandler', 'formatter': 'erreurs'},
+    },
+    'loggers': {
+        'django.request': {'handlers': ['stderr'], 'level': 'ERROR', 'propagate': False},
+    },
+}
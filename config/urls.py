@@ -1,12 +1,10 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
+from interface.views import servir_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    re_path(r'^%s(?P<chemin>.+)$' % settings.MEDIA_URL.lstrip('/'), servir_media, name='media'),
     path('', include('interface.urls')),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,27 +1,62 @@
-from django.contrib import admin
-from .models import ImageAnnotation
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import SEARCH_VAR
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Max
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+from .models import ImageAnnotation, TraitementLot
+from .traitements import CHAMPS_RECHERCHE, lancer_traitement
 from .utils import geocoder_adresse
 
 
+class PaginateurEstime(Paginator):
+    """
+    Paginateur qui estime le nombre total de lignes d'une table non filtrée
+    au lieu de lancer un COUNT(*) complet à chaque page.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is None or query.where:
+            return super().count
+        modele = self.object_list.model
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [modele._meta.db_table])
+                ligne = cursor.fetchone()
+            if ligne and ligne[0] > 0:
+                return ligne[0]
+        # Ailleurs (SQLite) : le plus grand identifiant, lu sur l'index de la clé primaire
+        return modele._default_manager.aggregate(dernier=Max('pk'))['dernier'] or 0
+
+
 @admin.register(ImageAnnotation)
 class ImageAnnotationAdmin(admin.ModelAdmin):
     list_display = [
-        'id', 'image_thumbnail', 'annotation', 'annotation_automatique', 
+        'id', 'image_thumbnail', 'annotation', 'annotation_automatique',
         'date_ajout', 'taille_fichier', 'localisation'
     ]
     list_filter = ['annotation', 'annotation_automatique', 'date_ajout']
-    search_fields = ['localisation']
+    search_fields = list(CHAMPS_RECHERCHE)
+    date_hierarchy = 'date_ajout'
+    paginator = PaginateurEstime
+    show_full_result_count = False
+    actions = ['action_reextraire', 'action_reclassifier', 'action_regeocoder']
     readonly_fields = [
         'date_ajout', 'taille_fichier', 'largeur', 'hauteur',
         'couleur_moyenne_r', 'couleur_moyenne_g', 'couleur_moyenne_b',
         'luminance_moyenne', 'contraste', 'annotation_automatique'
     ]
-    
+
     def image_thumbnail(self, obj):
         if obj.image:
-            return f'<img src="{obj.image.url}" width="50" height="50" style="object-fit: cover;" />'
+            # Miniature générée une fois puis servie depuis le cache d'artefacts
+            url = reverse('artefact_image', args=[obj.id, 'miniature'])
+            return format_html('<img src="{}" width="50" height="50" loading="lazy" style="object-fit: cover;" />', url)
         return "Pas d'image"
-    image_thumbnail.allow_tags = True
     image_thumbnail.short_description = 'Aperçu'
 
     def save_model(self, request, obj, form, change):
@@ -32,7 +67,39 @@ class ImageAnnotationAdmin(admin.ModelAdmin):
                 obj.longitude = lon
         super().save_model(request, obj, form, change)
 
-    
+    def _lancer(self, request, queryset, action):
+        if request.POST.get('select_across') == '1':
+            # « Sélectionner tous les résultats » : le traitement garde les filtres de la liste,
+            # pas la liste (potentiellement énorme) des identifiants
+            champs_filtres = {*self.list_filter, self.date_hierarchy}
+            filtres = {
+                parametre: valeurs for parametre, valeurs in request.GET.lists()
+                if parametre.split('__')[0] in champs_filtres
+            }
+            traitement = lancer_traitement(action, filtres=filtres, recherche=request.GET.get(SEARCH_VAR, ''))
+        else:
+            traitement = lancer_traitement(action, identifiants=list(queryset.values_list('pk', flat=True)))
+        url = reverse('admin:interface_traitementlot_change', args=[traitement.pk])
+        self.message_user(
+            request,
+            format_html('Traitement « {} » lancé sur {} image(s). <a href="{}">Suivre la progression</a>',
+                        traitement.get_action_display(), traitement.total, url),
+            messages.SUCCESS,
+        )
+
+    @admin.action(description="Ré-extraire les caractéristiques")
+    def action_reextraire(self, request, queryset):
+        self._lancer(request, queryset, 'reextraire')
+
+    @admin.action(description="Reclassifier")
+    def action_reclassifier(self, request, queryset):
+        self._lancer(request, queryset, 'reclassifier')
+
+    @admin.action(description="Re-géocoder")
+    def action_regeocoder(self, request, queryset):
+        self._lancer(request, queryset, 'regeocoder')
+
+
     fieldsets = (
         ('Image et Annotation', {
             'fields': ('image', 'annotation', 'annotation_automatique', 'localisation')
@@ -50,3 +117,21 @@ class ImageAnnotationAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+
+
+@admin.register(TraitementLot)
+class TraitementLotAdmin(admin.ModelAdmin):
+    list_display = ['id', 'action', 'statut', 'barre_progression', 'erreurs', 'date_creation', 'date_fin']
+    list_filter = ['action', 'statut']
+    readonly_fields = [
+        'action', 'statut', 'total', 'traites', 'erreurs', 'message',
+        'curseur', 'pk_max', 'date_creation', 'date_maj', 'date_fin',
+    ]
+    exclude = ['jeton']
+
+    def barre_progression(self, obj):
+        return format_html('<progress value="{}" max="100"></progress> {} / {}', obj.progression, obj.traites, obj.total)
+    barre_progression.short_description = 'Progression'
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,274 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from io import BytesIO
+
+from PIL import Image
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows : regroupement des rendus limité au processus courant
+    fcntl = None
+
+# Incrémenter pour invalider le cache quand le rendu change
+VERSION_RENDU = 1
+
+TYPES_ARTEFACTS = ('histogramme_rgb', 'histogramme_luminance', 'contours', 'miniature')
+SEUILS_CANNY_DEFAUT = (100, 200)
+TAILLE_MINIATURE = 100
+
+
+def _figure_png(fig):
+    buf = BytesIO()
+    fig.savefig(buf, format='png')
+    return buf.getvalue()
+
+
+def rendre_histogramme_rgb(chemin_image, titre="Histogramme RVB"):
+    """Retourne l'histogramme RVB de l'image au format PNG."""
+    # Figure autonome (sans pyplot ni son état global) : sûr quand plusieurs threads rendent.
+    # Importée ici pour ne pas charger matplotlib au démarrage.
+    import numpy as np
+    from matplotlib.figure import Figure
+
+    with Image.open(chemin_image).convert("RGB") as image:
+        np_image = np.array(image)
+
+    fig = Figure(figsize=(8, 4))
+    ax = fig.add_subplot()
+    ax.hist(np_image[:, :, 0].flatten(), bins=256, color='red', alpha=0.5, label='Rouge')
+    ax.hist(np_image[:, :, 1].flatten(), bins=256, color='green', alpha=0.5, label='Vert')
+    ax.hist(np_image[:, :, 2].flatten(), bins=256, color='blue', alpha=0.5, label='Bleu')
+    ax.set_title(titre)
+    ax.set_xlabel("Valeur de pixel")
+    ax.set_ylabel("Nombre de pixels")
+    ax.legend()
+    fig.tight_layout()
+    return _figure_png(fig)
+
+
+def rendre_histogramme_luminance(chemin_image, titre="Histogramme de luminance"):
+    """Retourne l'histogramme de luminance (niveaux de gris) au format PNG."""
+    import numpy as np
+    from matplotlib.figure import Figure
+
+    with Image.open(chemin_image).convert("L") as image:
+        np_image = np.array(image)
+
+    fig = Figure(figsize=(8, 4))
+    ax = fig.add_subplot()
+    ax.hist(np_image.flatten(), bins=256, range=(0, 255), color='gray', alpha=0.8)
+    ax.set_title(titre)
+    ax.set_xlabel('Luminance (0 = noir, 255 = blanc)')
+    ax.set_ylabel('Nombre de pixels')
+    ax.grid(True)
+    fig.tight_layout()
+    return _figure_png(fig)
+
+
+def rendre_contours(chemin_image, seuil_bas=SEUILS_CANNY_DEFAUT[0], seuil_haut=SEUILS_CANNY_DEFAUT[1]):
+    """Retourne les contours (Canny) de l'image au format PNG."""
+    import cv2
+
+    image = cv2.imread(chemin_image, cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise ValueError(f"Impossible de lire l'image : {chemin_image}")
+    edges = cv2.Canny(image, threshold1=seuil_bas, threshold2=seuil_haut)
+    ok, png = cv2.imencode('.png', edges)
+    if not ok:
+        raise ValueError(f"Impossible d'encoder les contours : {chemin_image}")
+    return png.tobytes()
+
+
+def rendre_miniature(chemin_image, taille=TAILLE_MINIATURE):
+    """Retourne une miniature carrée (recadrée au centre) de l'image au format PNG."""
+    from PIL import ImageOps
+
+    with Image.open(chemin_image) as image:
+        miniature = ImageOps.fit(image.convert("RGB"), (taille, taille))
+    buf = BytesIO()
+    miniature.save(buf, format='PNG', optimize=True)
+    return buf.getvalue()
+
+
+def rendre(type_artefact, chemin_image, **params):
+    if type_artefact == 'histogramme_rgb':
+        return rendre_histogramme_rgb(chemin_image)
+    if type_artefact == 'histogramme_luminance':
+        return rendre_histogramme_luminance(chemin_image)
+    if type_artefact == 'contours':
+        return rendre_contours(chemin_image, **params)
+    if type_artefact == 'miniature':
+        return rendre_miniature(chemin_image)
+    raise ValueError(f"Type d'artefact inconnu : {type_artefact}")
+
+
+@lru_cache(maxsize=1024)
+def _empreinte(chemin, mtime_ns, taille):
+    sha = hashlib.sha256()
+    with open(chemin, 'rb') as f:
+        for bloc in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(bloc)
+    return sha.hexdigest()
+
+
+NOM_ADRESSE_CONTENU = re.compile(r'^([0-9a-f]{64})\.\w+$')
+
+
+def empreinte_image(chemin):
+    """
+    SHA-256 du contenu de l'image : lu dans le nom de fichier pour le stockage adressé par
+    contenu, sinon calculé et mémorisé tant que le fichier n'est pas modifié.
+    """
+    m = NOM_ADRESSE_CONTENU.match(os.path.basename(chemin))
+    if m:
+        return m.group(1)
+    stat = os.stat(chemin)
+    return _empreinte(chemin, stat.st_mtime_ns, stat.st_size)
+
+
+class CacheArtefacts:
+    """
+    Cache disque borné en taille, avec éviction LRU (date de modification rafraîchie à
+    chaque lecture). Les rendus concurrents d'un même artefact, entre threads comme entre
+    workers, sont regroupés en un seul.
+    """
+
+    # Après éviction, on redescend sous cette fraction du maximum pour espacer les parcours
+    RATIO_APRES_EVICTION = 0.9
+    # Resynchronisation périodique du total (écritures des autres processus), en secondes
+    INTERVALLE_RESYNCHRONISATION = 600
+
+    def __init__(self, dossier, taille_max):
+        self.dossier = str(dossier)
+        self.taille_max = taille_max
+        self._verrou = threading.Lock()
+        self._verrous_cles = {}
+        # Taille totale estimée ; None tant que le dossier n'a pas été parcouru
+        self._taille_totale = None
+        self._dernier_parcours = 0.0
+        self._parcours_en_cours = False
+
+    def chemin(self, cle):
+        # Les clés commencent par l'empreinte de l'image : même découpage ab/cd/ que les médias
+        return os.path.join(self.dossier, cle[:2], cle[2:4], f"{cle}.png")
+
+    def obtenir(self, cle, rendu):
+        """Retourne le chemin de l'artefact `cle`, en l'obtenant via `rendu()` s'il est absent."""
+        chemin = self.chemin(cle)
+        if self._toucher(chemin):
+            return chemin
+
+        with self._verrou:
+            verrou_cle = self._verrous_cles.setdefault(cle, threading.Lock())
+        try:
+            with verrou_cle, self._verrou_fichier(chemin):
+                # Un autre thread ou worker a pu terminer le rendu pendant l'attente
+                if self._toucher(chemin):
+                    return chemin
+                contenu = rendu()
+                temporaire = f"{chemin}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(temporaire, 'wb') as f:
+                    f.write(contenu)
+                os.replace(temporaire, chemin)
+        finally:
+            with self._verrou:
+                # Un thread arrivé après notre fin a pu déposer son propre verrou : ne retirer que le nôtre
+                if self._verrous_cles.get(cle) is verrou_cle:
+                    del self._verrous_cles[cle]
+
+        self._ajouter(len(contenu))
+        return chemin
+
+    @contextmanager
+    def _verrou_fichier(self, chemin):
+        """Verrou exclusif sur `<chemin>.lock`, partagé entre les workers (processus) du serveur."""
+        os.makedirs(os.path.dirname(chemin), exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(f"{chemin}.lock", 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _ajouter(self, taille):
+        """Met à jour le total estimé et ne parcourt le dossier que s'il dépasse le budget."""
+        with self._verrou:
+            perime = time.monotonic() - self._dernier_parcours > self.INTERVALLE_RESYNCHRONISATION
+            if self._taille_totale is not None:
+                self._taille_totale += taille
+            if self._parcours_en_cours:
+                return
+            if self._taille_totale is not None and self._taille_totale <= self.taille_max and not perime:
+                return
+            self._parcours_en_cours = True
+        try:
+            self.evincer()
+        finally:
+            with self._verrou:
+                self._parcours_en_cours = False
+
+    def _toucher(self, chemin):
+        try:
+            os.utime(chemin)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def evincer(self):
+        """
+        Parcourt le cache, supprime les artefacts les moins récemment utilisés au-delà de
+        la taille maximale et resynchronise le total estimé.
+        """
+        fichiers = []
+        total = 0
+        for racine, _, noms in os.walk(self.dossier):
+            for nom in noms:
+                if not nom.endswith('.png'):
+                    continue
+                chemin = os.path.join(racine, nom)
+                try:
+                    stat = os.stat(chemin)
+                except FileNotFoundError:
+                    continue
+                fichiers.append((stat.st_mtime, stat.st_size, chemin))
+                total += stat.st_size
+        if total > self.taille_max:
+            cible = self.taille_max * self.RATIO_APRES_EVICTION
+            for _, taille, chemin in sorted(fichiers):
+                for fichier in (chemin, f"{chemin}.lock"):
+                    try:
+                        os.remove(fichier)
+                    except FileNotFoundError:
+                        pass
+                total -= taille
+                if total <= cible:
+                    break
+        with self._verrou:
+            self._taille_totale = total
+            self._dernier_parcours = time.monotonic()
+
+
+cache_artefacts = CacheArtefacts(settings.ARTEFACTS_CACHE_DIR, settings.ARTEFACTS_CACHE_TAILLE_MAX)
+
+
+def cle_artefact(chemin_image, type_artefact, **params):
+    """Clé de cache (et ETag) d'un artefact : empreinte de l'image, type, paramètres, version."""
+    if type_artefact not in TYPES_ARTEFACTS:
+        raise ValueError(f"Type d'artefact inconnu : {type_artefact}")
+    suffixe = ''.join(f"_{nom}{valeur}" for nom, valeur in sorted(params.items()))
+    return f"{empreinte_image(chemin_image)}_{type_artefact}{suffixe}_v{VERSION_RENDU}"
+
+
+def obtenir_artefact(chemin_image, type_artefact, **params):
+    """Chemin du PNG de l'artefact pour cette image, généré à la première demande."""
+    cle = cle_artefact(chemin_image, type_artefact, **params)
+    return cache_artefacts.obtenir(cle, lambda: rendre(type_artefact, chemin_image, **params))
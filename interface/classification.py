@@ -0,0 +1,85 @@
+from PIL import Image
+
+CHAMPS_CARACTERISTIQUES = (
+    'taille_fichier', 'largeur', 'hauteur',
+    'couleur_moyenne_r', 'couleur_moyenne_g', 'couleur_moyenne_b',
+    'luminance_moyenne', 'contraste',
+)
+# Nombre de pixels traités à la fois pour le contraste
+TAILLE_TRANCHE = 1 << 20
+
+
+def extraire_caracteristiques_image(source, taille_octets):
+    """
+    Calcule les caractéristiques d'une image (chemin ou fichier ouvert) en une passe NumPy.
+    Retourne un dict dont les clés sont CHAMPS_CARACTERISTIQUES.
+    """
+    import numpy as np
+
+    with Image.open(source) as img:
+        largeur, hauteur = img.size
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        pixels = np.asarray(img).reshape(-1, 3)
+
+    caracteristiques = {
+        'taille_fichier': round(taille_octets / 1024, 2),  # En Ko
+        'largeur': largeur,
+        'hauteur': hauteur,
+    }
+    if not len(pixels):
+        return caracteristiques
+
+    # Sommes entières exactes, comme le calcul pixel par pixel d'origine
+    r_total, g_total, b_total = pixels.sum(axis=0, dtype=np.int64).tolist()
+    nb_pixels = len(pixels)
+    r, g, b = round(r_total / nb_pixels), round(g_total / nb_pixels), round(b_total / nb_pixels)
+    caracteristiques.update({
+        'couleur_moyenne_r': r,
+        'couleur_moyenne_g': g,
+        'couleur_moyenne_b': b,
+        # Luminance moyenne (formule standard)
+        'luminance_moyenne': round(0.299 * r + 0.587 * g + 0.114 * b, 2),
+    })
+
+    # Contraste (différence max-min de luminance) : mêmes opérations flottantes que le calcul
+    # pixel par pixel d'origine, par tranches pour borner la mémoire
+    lum_min, lum_max = float('inf'), float('-inf')
+    for debut in range(0, nb_pixels, TAILLE_TRANCHE):
+        tranche = pixels[debut:debut + TAILLE_TRANCHE]
+        luminances = 0.299 * tranche[:, 0] + 0.587 * tranche[:, 1] + 0.114 * tranche[:, 2]
+        lum_min = min(lum_min, float(luminances.min()))
+        lum_max = max(lum_max, float(luminances.max()))
+    caracteristiques['contraste'] = round(lum_max - lum_min, 2)
+    return caracteristiques
+
+
+def classifier(luminance_moyenne, contraste, taille_fichier):
+    """Arbre de décision ajusté : retourne 'pleine', 'vide', ou None si données incomplètes."""
+    if luminance_moyenne is None or taille_fichier is None or contraste is None:
+        return None
+    if luminance_moyenne <= 120:
+        if contraste <= 254.65:
+            return 'pleine' if luminance_moyenne <= 114.65 else 'vide'
+        return 'pleine'
+    return 'pleine' if contraste <= 226.78 else 'vide'
+
+
+def classifier_lot(luminances, contrastes, tailles):
+    """
+    Version vectorisée de `classifier` sur des listes de même longueur.
+    Les éléments aux données incomplètes (None) donnent None.
+    """
+    import numpy as np
+
+    lum = np.array([np.nan if v is None else v for v in luminances], dtype=float)
+    con = np.array([np.nan if v is None else v for v in contrastes], dtype=float)
+    tai = np.array([np.nan if v is None else v for v in tailles], dtype=float)
+
+    vide = np.where(
+        lum <= 120,
+        (con <= 254.65) & (lum > 114.65),
+        con > 226.78,
+    )
+    incomplet = np.isnan(lum) | np.isnan(con) | np.isnan(tai)
+    return [None if i else ('vide' if v else 'pleine') for v, i in zip(vide.tolist(), incomplet.tolist())]
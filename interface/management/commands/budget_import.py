@@ -0,0 +1,71 @@
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Dépendances lourdes qui ne doivent être chargées que dans les chemins qui les utilisent
+MODULES_INTERDITS = ('matplotlib', 'numpy', 'cv2', 'sklearn', 'scipy', 'geopy')
+
+# Démarrage d'un worker : configuration Django, URLs (donc vues) et admin
+SCRIPT_DEMARRAGE = (
+    "import django; django.setup(); "
+    "import config.urls, interface.admin, interface.views"
+)
+
+LIGNE_IMPORTTIME = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le temps d'import au démarrage (python -X importtime) et échoue si le budget "
+        "est dépassé ou si une dépendance lourde est chargée."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budget-ms', type=int, default=1500,
+                            help="Temps d'import cumulé maximal, en millisecondes (défaut : 1500).")
+        parser.add_argument('--top', type=int, default=10,
+                            help="Nombre de modules les plus coûteux à afficher.")
+
+    def handle(self, *args, **options):
+        resultat = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', SCRIPT_DEMARRAGE],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'config.settings'},
+        )
+        if resultat.returncode != 0:
+            raise CommandError(f"Le démarrage a échoué :\n{resultat.stderr[-2000:]}")
+
+        total_us = 0
+        cumuls = []
+        charges = set()
+        for ligne in resultat.stderr.splitlines():
+            m = LIGNE_IMPORTTIME.match(ligne)
+            if not m:
+                continue
+            propre, cumul, indentation, module = int(m.group(1)), int(m.group(2)), m.group(3), m.group(4)
+            total_us += propre
+            charges.add(module.split('.')[0])
+            # Les modules importés au premier niveau donnent le coût de chaque dépendance
+            if len(indentation) == 1:
+                cumuls.append((cumul, module))
+
+        total_ms = total_us / 1000
+        self.stdout.write(f"Temps d'import au démarrage : {total_ms:.0f} ms (budget : {options['budget_ms']} ms)")
+        for cumul, module in sorted(cumuls, reverse=True)[:options['top']]:
+            self.stdout.write(f"  {cumul / 1000:8.1f} ms  {module}")
+
+        erreurs = []
+        interdits = sorted(charges.intersection(MODULES_INTERDITS))
+        if interdits:
+            erreurs.append(f"Dépendances lourdes chargées au démarrage : {', '.join(interdits)}")
+        if total_ms > options['budget_ms']:
+            erreurs.append(f"Budget dépassé : {total_ms:.0f} ms > {options['budget_ms']} ms")
+        if erreurs:
+            raise CommandError("\n".join(erreurs))
+        self.stdout.write(self.style.SUCCESS("Budget d'import respecté."))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from interface.models import TraitementLot
+from interface.traitements import executer_traitement, traitements_a_reprendre
+
+
+class Command(BaseCommand):
+    help = (
+        "Reprend les traitements par lot abandonnés (bail expiré après un redémarrage) ou jamais "
+        "démarrés. Les traitements en cours dans un worker actif sont ignorés."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--surveiller', action='store_true',
+                            help="Ne pas s'arrêter : vérifier à intervalle régulier (lancé avec le serveur).")
+        parser.add_argument('--intervalle', type=float, default=60,
+                            help="Secondes entre deux vérifications avec --surveiller (défaut : 60).")
+
+    def handle(self, *args, **options):
+        while True:
+            self._reprendre()
+            if not options['surveiller']:
+                break
+            time.sleep(options['intervalle'])
+        self.stdout.write(self.style.SUCCESS("Traitements terminés."))
+
+    def _reprendre(self):
+        for traitement_id in traitements_a_reprendre():
+            self.stdout.write(f"Traitement {traitement_id} : {TraitementLot.objects.get(pk=traitement_id)}")
+            try:
+                if not executer_traitement(traitement_id):
+                    self.stdout.write("  déjà repris par un autre exécuteur.")
+            except Exception as e:
+                self.stderr.write(f"Traitement {traitement_id} en échec : {e}")
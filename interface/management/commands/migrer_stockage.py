@@ -0,0 +1,113 @@
+import os
+import re
+import shutil
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from interface.models import ImageAnnotation
+from interface.stockage import ARTEFACTS_DERIVES, chemin_shard, empreinte_contenu
+
+DEJA_SHARDE = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$')
+
+
+def _lier(source, destination):
+    """Crée `destination` sans toucher à `source` (lien physique, sinon copie)."""
+    if os.path.exists(destination):
+        return
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+class Command(BaseCommand):
+    help = (
+        "Déplace les images existantes (et leurs artefacts) vers l'arborescence adressée par "
+        "contenu ab/cd/<sha256>.<ext> et réécrit ImageAnnotation.image par lots."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Nombre d'images traitées par lot (défaut : 500).")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Affiche les déplacements sans rien modifier.")
+
+    def handle(self, *args, **options):
+        taille_lot = options['batch_size']
+        dry_run = options['dry_run']
+        dernier_id = 0
+        migrees = ignorees = manquantes = 0
+        # Noms écrits par cette exécution : lignes déjà réécrites avec un fichier partagé
+        nouveaux_noms = set()
+
+        while True:
+            lot = list(
+                ImageAnnotation.objects.filter(pk__gt=dernier_id).order_by('pk').only('pk', 'image')[:taille_lot]
+            )
+            if not lot:
+                break
+            dernier_id = lot[-1].pk
+
+            # Ancien nom -> (nouveau nom, anciens fichiers) ; plusieurs lignes peuvent partager un fichier
+            renommages = {}
+            for image_annotation in lot:
+                ancien_nom = image_annotation.image.name
+                if ancien_nom in nouveaux_noms:
+                    continue
+                if not ancien_nom or DEJA_SHARDE.search(ancien_nom):
+                    ignorees += 1
+                    continue
+                if ancien_nom in renommages:
+                    continue
+                ancien_chemin = default_storage.path(ancien_nom)
+                if not os.path.isfile(ancien_chemin):
+                    self.stderr.write(f"Image {image_annotation.pk} : fichier introuvable ({ancien_nom})")
+                    manquantes += 1
+                    continue
+
+                with open(ancien_chemin, 'rb') as f:
+                    empreinte = empreinte_contenu(File(f))
+                dossier = os.path.dirname(ancien_nom)
+                nouveau_nom = chemin_shard(dossier, empreinte, os.path.splitext(ancien_nom)[1])
+                self.stdout.write(f"Image {image_annotation.pk} : {ancien_nom} -> {nouveau_nom}")
+                if dry_run:
+                    continue
+
+                # Les nouveaux chemins sont créés avant l'écriture en base, les anciens supprimés après
+                nouveau_chemin = default_storage.path(nouveau_nom)
+                _lier(ancien_chemin, nouveau_chemin)
+                anciens_fichiers = [ancien_chemin]
+
+                ancienne_racine = os.path.splitext(os.path.basename(ancien_nom))[0]
+                for sous_dossier, suffixe in ARTEFACTS_DERIVES:
+                    ancien_artefact = os.path.join(os.path.dirname(ancien_chemin), sous_dossier, ancienne_racine + suffixe)
+                    if os.path.isfile(ancien_artefact):
+                        _lier(ancien_artefact, os.path.join(os.path.dirname(nouveau_chemin), sous_dossier, empreinte + suffixe))
+                        anciens_fichiers.append(ancien_artefact)
+
+                renommages[ancien_nom] = (nouveau_nom, anciens_fichiers)
+
+            if renommages:
+                # UPDATE par ancien nom : les lignes des lots suivants qui partagent le fichier sont
+                # réécrites en même temps. Ni save() ni signaux : pas de ré-extraction.
+                with transaction.atomic():
+                    for ancien_nom, (nouveau_nom, _) in renommages.items():
+                        migrees += ImageAnnotation.objects.filter(image=ancien_nom).update(image=nouveau_nom)
+                        nouveaux_noms.add(nouveau_nom)
+                for ancien_nom, (_, anciens_fichiers) in renommages.items():
+                    # Une ligne créée entre-temps peut encore pointer vers l'ancien fichier
+                    if ImageAnnotation.objects.filter(image=ancien_nom).exists():
+                        continue
+                    for chemin in anciens_fichiers:
+                        try:
+                            os.remove(chemin)
+                        except FileNotFoundError:
+                            pass
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{migrees} image(s) migrée(s), {ignorees} déjà en place, {manquantes} fichier(s) manquant(s)."
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from interface.statistiques import reconstruire_compteurs
+
+
+class Command(BaseCommand):
+    help = "Reconstruit la table des compteurs temporels (par heure et par jour) à partir des images."
+
+    def handle(self, *args, **options):
+        nombre = reconstruire_compteurs()
+        self.stdout.write(self.style.SUCCESS(f"{nombre} compteurs reconstruits."))
@@ -0,0 +1,335 @@
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from io import BytesIO
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Débit par défaut (requêtes par seconde) de chaque scénario
+DEBITS_DEFAUT = {
+    'upload': 0.5,
+    'annoter': 1.0,
+    'dashboard': 2.0,
+    'liste': 1.0,
+    'stats': 5.0,
+}
+NB_IMAGES_INITIALES = 5
+# Début de l'enregistrement django.request d'une réponse 500 (voir LOGGING)
+MOTIF_ERREUR_SERVEUR = re.compile(r'Internal Server Error: (\S+)')
+# Dernière ligne du traceback d'une écriture SQLite bloquée. L'exception sqlite3 chaînée
+# (« sqlite3.OperationalError: ... ») apparaît dans le même traceback : ne compter que celle-ci.
+MOTIF_VERROU = 'django.db.utils.OperationalError: database is locked'
+
+
+class _SansRedirection(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def _images_synthetiques(nombre=8):
+    """Quelques JPEG aléatoires (taille de photo terrain réduite) servant de base aux uploads."""
+    from PIL import Image, ImageDraw
+
+    images = []
+    for _ in range(nombre):
+        img = Image.new('RGB', (640, 480), tuple(random.randint(0, 255) for _ in range(3)))
+        dessin = ImageDraw.Draw(img)
+        for _ in range(40):
+            x, y = random.randint(0, 600), random.randint(0, 440)
+            dessin.rectangle([x, y, x + random.randint(10, 120), y + random.randint(10, 120)],
+                             fill=tuple(random.randint(0, 255) for _ in range(3)))
+        buf = BytesIO()
+        img.save(buf, format='JPEG', quality=85)
+        images.append(buf.getvalue())
+    return images
+
+
+def _multipart(champs, fichiers):
+    limite = uuid.uuid4().hex
+    corps = BytesIO()
+    for nom, valeur in champs.items():
+        corps.write(f'--{limite}\r\nContent-Disposition: form-data; name="{nom}"\r\n\r\n{valeur}\r\n'.encode())
+    for nom, (nom_fichier, contenu, type_mime) in fichiers.items():
+        corps.write(
+            f'--{limite}\r\nContent-Disposition: form-data; name="{nom}"; filename="{nom_fichier}"\r\n'
+            f'Content-Type: {type_mime}\r\n\r\n'.encode()
+        )
+        corps.write(contenu)
+        corps.write(b'\r\n')
+    corps.write(f'--{limite}--\r\n'.encode())
+    return corps.getvalue(), f'multipart/form-data; boundary={limite}'
+
+
+def _compter_verrous(journal):
+    """Erreurs « database is locked » consignées par le serveur, par point d'accès."""
+    verrous = defaultdict(int)
+    chemin = '?'
+    try:
+        with open(journal, encoding='utf-8', errors='replace') as f:
+            for ligne in f:
+                m = MOTIF_ERREUR_SERVEUR.search(ligne)
+                if m:
+                    # /annoter/42/ -> /annoter/<id>/ : regroupement par point d'accès
+                    chemin = re.sub(r'\d+', '<id>', m.group(1))
+                elif ligne.startswith(MOTIF_VERROU):
+                    verrous[chemin] += 1
+    except FileNotFoundError:
+        pass
+    return verrous
+
+
+def _centile(valeurs, p):
+    if not valeurs:
+        return 0.0
+    rang = min(len(valeurs) - 1, max(0, round(p / 100 * len(valeurs)) - 1))
+    return valeurs[rang]
+
+
+class Client:
+    """Rejoue les requêtes des scénarios et garde les identifiants d'images créés."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.cookies = CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), _SansRedirection()
+        )
+        self.images_base = _images_synthetiques()
+        self.image_ids = []
+        self._verrou = threading.Lock()
+        self.csrf = None
+
+    def requete(self, chemin, donnees=None, type_contenu=None):
+        """Retourne (statut, corps, en-têtes). Les 3xx ne sont pas suivis."""
+        requete = urllib.request.Request(self.base_url + chemin, data=donnees)
+        if type_contenu:
+            requete.add_header('Content-Type', type_contenu)
+        if self.csrf:
+            requete.add_header('X-CSRFToken', self.csrf)
+            requete.add_header('Referer', self.base_url + chemin)
+        try:
+            with self.opener.open(requete, timeout=60) as reponse:
+                return reponse.status, reponse.read(), reponse.headers
+        except urllib.error.HTTPError as e:
+            return e.code, e.read(), e.headers
+
+    def initialiser(self):
+        self.requete('/upload/')
+        self.csrf = next((c.value for c in self.cookies if c.name == 'csrftoken'), None)
+        if not self.csrf:
+            raise CommandError("Impossible d'obtenir le jeton CSRF depuis /upload/.")
+        for _ in range(NB_IMAGES_INITIALES):
+            self.upload()
+
+    def upload(self):
+        # Octets aléatoires après la fin du JPEG : fichier unique, donc non dédupliqué par le stockage
+        contenu = random.choice(self.images_base) + os.urandom(16)
+        corps, type_contenu = _multipart(
+            {
+                'csrfmiddlewaretoken': self.csrf,
+                'localisation': 'Test de charge',
+                'latitude': f"{48.85 + random.uniform(-0.05, 0.05):.6f}",
+                'longitude': f"{2.35 + random.uniform(-0.05, 0.05):.6f}",
+            },
+            {'image': (f"charge_{uuid.uuid4().hex}.jpg", contenu, 'image/jpeg')},
+        )
+        statut, corps_reponse, entetes = self.requete('/upload/', corps, type_contenu)
+        m = re.search(r'/annoter/(\d+)/', entetes.get('Location', '') or '')
+        if statut == 302 and m:
+            with self._verrou:
+                self.image_ids.append(int(m.group(1)))
+            return 200, corps_reponse
+        # Le formulaire ré-affiché (200) signifie un upload refusé
+        return (statut if statut != 200 else 422), corps_reponse
+
+    def annoter(self):
+        with self._verrou:
+            image_id = random.choice(self.image_ids) if self.image_ids else None
+        if image_id is None:
+            return self.upload()
+        corps = urllib.parse.urlencode({
+            'csrfmiddlewaretoken': self.csrf,
+            'annotation': random.choice(['pleine', 'vide']),
+        }).encode()
+        statut, corps_reponse, _ = self.requete(f'/annoter/{image_id}/', corps, 'application/x-www-form-urlencoded')
+        return (200 if statut == 302 else statut), corps_reponse
+
+    def get(self, chemin):
+        statut, corps, _ = self.requete(chemin)
+        return statut, corps
+
+
+class Command(BaseCommand):
+    help = (
+        "Test de charge : lance l'application localement (base et médias jetables) et rejoue un "
+        "mélange d'uploads, d'annotations et de lectures du dashboard à débit fixe, puis affiche "
+        "latences (p50/p95/p99), erreurs (dont « database is locked ») et débit par point d'accès."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duree', type=float, default=30, help="Durée du test en secondes (défaut : 30).")
+        parser.add_argument('--concurrence', type=int, default=32, help="Nombre maximal de requêtes simultanées.")
+        for scenario, debit in DEBITS_DEFAUT.items():
+            parser.add_argument(f'--{scenario}', type=float, default=debit,
+                                help=f"Requêtes/s pour « {scenario} » (défaut : {debit}).")
+        parser.add_argument('--url', help="Cibler un serveur déjà lancé au lieu d'en démarrer un "
+                                          "(les verrous SQLite ne sont alors pas comptés).")
+        parser.add_argument('--serveur', choices=['runserver', 'gunicorn'], default='runserver',
+                            help="Serveur à démarrer localement (défaut : runserver).")
+        parser.add_argument('--workers', type=int, default=2, help="Workers gunicorn (défaut : 2).")
+        parser.add_argument('--threads', type=int, default=4, help="Threads par worker gunicorn (défaut : 4).")
+        parser.add_argument('--base', help="Fichier SQLite à utiliser (défaut : base temporaire migrée).")
+
+    def handle(self, *args, **options):
+        processus = None
+        verrous_journal = None
+        with tempfile.TemporaryDirectory(prefix='wdp_charge_') as dossier:
+            journal = os.path.join(dossier, 'serveur.log')
+            if options['url']:
+                base_url = options['url']
+            else:
+                base_url, processus = self._demarrer_serveur(options, dossier, journal)
+            try:
+                resultats, duree = self._executer(base_url, options)
+            finally:
+                if processus:
+                    processus.terminate()
+                    processus.wait(timeout=10)
+                    verrous_journal = _compter_verrous(journal)
+        self._rapport(resultats, duree, verrous_journal)
+
+    def _demarrer_serveur(self, options, dossier, journal):
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': 'config.settings',
+            # Comme en production : sans DEBUG (pas de requêtes SQL gardées en mémoire ni de
+            # pages d'erreur détaillées), statiques collectés ; les erreurs vont au journal (LOGGING)
+            'DJANGO_DEBUG': 'false',
+            'DJANGO_ALLOWED_HOSTS': '127.0.0.1,localhost',
+            'WDP_STATIC_ROOT': os.path.join(dossier, 'static'),
+            'WDP_DATABASE_PATH': options['base'] or os.path.join(dossier, 'charge.sqlite3'),
+            'WDP_MEDIA_ROOT': os.path.join(dossier, 'media'),
+        }
+        manage = os.path.join(settings.BASE_DIR, 'manage.py')
+        for commande in (['migrate', '--noinput'], ['collectstatic', '--noinput']):
+            subprocess.run([sys.executable, manage, *commande], env=env, check=True,
+                           stdout=subprocess.DEVNULL)
+
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        if options['serveur'] == 'gunicorn':
+            commande = [sys.executable, '-m', 'gunicorn', 'config.wsgi:application',
+                        '--bind', f'127.0.0.1:{port}', '--workers', str(options['workers']),
+                        '--threads', str(options['threads'])]
+        else:
+            commande = [sys.executable, manage, 'runserver', f'127.0.0.1:{port}', '--noreload']
+        # Les tracebacks des erreurs serveur vont dans le journal, relu à la fin du test
+        with open(journal, 'wb') as sortie_erreurs:
+            processus = subprocess.Popen(commande, cwd=settings.BASE_DIR, env=env,
+                                         stdout=subprocess.DEVNULL, stderr=sortie_erreurs)
+
+        base_url = f'http://127.0.0.1:{port}'
+        limite = time.monotonic() + 30
+        while time.monotonic() < limite:
+            if processus.poll() is not None:
+                raise CommandError("Le serveur s'est arrêté au démarrage.")
+            try:
+                urllib.request.urlopen(base_url + '/api/stats/', timeout=2).read()
+                self.stdout.write(f"Serveur {options['serveur']} prêt sur {base_url}")
+                return base_url, processus
+            except OSError:
+                time.sleep(0.3)
+        processus.terminate()
+        raise CommandError("Le serveur n'a pas répondu dans les 30 secondes.")
+
+    def _executer(self, base_url, options):
+        client = Client(base_url)
+        client.initialiser()
+        scenarios = {
+            'upload': client.upload,
+            'annoter': client.annoter,
+            'dashboard': lambda: client.get('/'),
+            'liste': lambda: client.get('/images/'),
+            'stats': lambda: client.get('/api/stats/'),
+        }
+        resultats = defaultdict(list)
+        verrou = threading.Lock()
+
+        def executer(scenario, prevu):
+            try:
+                statut, corps = scenarios[scenario]()
+                erreur = None
+                if statut >= 400:
+                    erreur = f'HTTP {statut}'
+            except Exception as e:
+                erreur = type(e).__name__
+            # Latence mesurée depuis l'instant prévu : inclut l'attente si le serveur sature
+            latence = time.monotonic() - prevu
+            with verrou:
+                resultats[scenario].append((latence, erreur))
+
+        self.stdout.write(f"Test de charge pendant {options['duree']:.0f} s...")
+        debut = time.monotonic()
+        fin = debut + options['duree']
+        # Charge en boucle ouverte : chaque scénario est planifié selon un processus de Poisson
+        prochains = {s: debut + random.expovariate(options[s]) for s in scenarios if options[s] > 0}
+        with ThreadPoolExecutor(max_workers=options['concurrence']) as pool:
+            while prochains:
+                scenario, instant = min(prochains.items(), key=lambda item: item[1])
+                if instant >= fin:
+                    break
+                attente = instant - time.monotonic()
+                if attente > 0:
+                    time.sleep(attente)
+                pool.submit(executer, scenario, instant)
+                prochains[scenario] = instant + random.expovariate(options[scenario])
+        return resultats, time.monotonic() - debut
+
+    def _rapport(self, resultats, duree, verrous_journal=None):
+        self.stdout.write("")
+        self.stdout.write(
+            f"{'Scénario':<14}{'Requêtes':>10}{'Débit/s':>9}{'p50 ms':>9}{'p95 ms':>9}"
+            f"{'p99 ms':>9}{'max ms':>9}{'Erreurs':>9}"
+        )
+        for scenario in DEBITS_DEFAUT:
+            mesures = resultats.get(scenario, [])
+            if not mesures:
+                continue
+            latences = sorted(latence * 1000 for latence, _ in mesures)
+            erreurs = [erreur for _, erreur in mesures if erreur]
+            self.stdout.write(
+                f"{scenario:<14}{len(mesures):>10}{len(mesures) / duree:>9.2f}"
+                f"{_centile(latences, 50):>9.0f}{_centile(latences, 95):>9.0f}{_centile(latences, 99):>9.0f}"
+                f"{latences[-1]:>9.0f}{100 * len(erreurs) / len(mesures):>8.1f}%"
+            )
+        types_erreurs = defaultdict(int)
+        for mesures in resultats.values():
+            for _, erreur in mesures:
+                if erreur:
+                    types_erreurs[erreur] += 1
+        if types_erreurs:
+            self.stdout.write("")
+            self.stdout.write("Erreurs :")
+            for erreur, nombre in sorted(types_erreurs.items(), key=lambda item: -item[1]):
+                self.stdout.write(f"  {nombre:>6}  {erreur}")
+        if verrous_journal is not None:
+            self.stdout.write("")
+            self.stdout.write(f"Verrous SQLite (« database is locked ») dans le journal du serveur : "
+                              f"{sum(verrous_journal.values())}")
+            for chemin, nombre in sorted(verrous_journal.items(), key=lambda item: -item[1]):
+                self.stdout.write(f"  {nombre:>6}  {chemin}")
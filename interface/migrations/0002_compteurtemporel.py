@@ -0,0 +1,28 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('interface', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompteurTemporel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularite', models.CharField(choices=[('heure', 'Heure'), ('jour', 'Jour')], max_length=5, verbose_name='Granularité')),
+                ('debut', models.DateTimeField(verbose_name='Début de la période')),
+                ('annotation', models.CharField(choices=[('pleine', 'Pleine'), ('vide', 'Vide'), ('non_annotee', 'Non annotée')], max_length=20, verbose_name='État de la poubelle')),
+                ('annotation_automatique', models.CharField(choices=[('pleine', 'Pleine'), ('vide', 'Vide'), ('non_annotee', 'Non annotée')], max_length=20, verbose_name='Classification automatique')),
+                ('nombre', models.IntegerField(default=0, verbose_name="Nombre d'images")),
+            ],
+            options={
+                'verbose_name': 'Compteur temporel',
+                'verbose_name_plural': 'Compteurs temporels',
+                'ordering': ['granularite', 'debut'],
+                'constraints': [models.UniqueConstraint(fields=('granularite', 'debut', 'annotation', 'annotation_automatique'), name='compteur_temporel_unique')],
+            },
+        ),
+    ]
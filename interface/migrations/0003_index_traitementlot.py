@@ -0,0 +1,44 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('interface', '0002_compteurtemporel'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='imageannotation',
+            index=models.Index(fields=['date_ajout'], name='image_date_ajout_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='imageannotation',
+            index=models.Index(fields=['annotation', 'date_ajout'], name='image_annotation_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='imageannotation',
+            index=models.Index(fields=['annotation_automatique', 'date_ajout'], name='image_auto_date_idx'),
+        ),
+        migrations.CreateModel(
+            name='TraitementLot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('reextraire', 'Ré-extraire les caractéristiques'), ('reclassifier', 'Reclassifier'), ('regeocoder', 'Re-géocoder')], max_length=20, verbose_name='Action')),
+                ('statut', models.CharField(choices=[('en_attente', 'En attente'), ('en_cours', 'En cours'), ('termine', 'Terminé'), ('echec', 'Échec')], default='en_attente', max_length=20, verbose_name='Statut')),
+                ('image_ids', models.JSONField(default=list, verbose_name='Images')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Total')),
+                ('traites', models.PositiveIntegerField(default=0, verbose_name='Traités')),
+                ('erreurs', models.PositiveIntegerField(default=0, verbose_name='Erreurs')),
+                ('message', models.TextField(blank=True, verbose_name='Message')),
+                ('date_creation', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Créé le')),
+                ('date_fin', models.DateTimeField(blank=True, null=True, verbose_name='Terminé le')),
+            ],
+            options={
+                'verbose_name': 'Traitement par lot',
+                'verbose_name_plural': 'Traitements par lot',
+                'ordering': ['-date_creation'],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+from collections import Counter
+from datetime import timezone as dt_timezone
+
+from django.db import migrations
+from django.utils import timezone
+
+
+def remplir_compteurs(apps, schema_editor):
+    """Initialise les compteurs temporels à partir des images existantes."""
+    ImageAnnotation = apps.get_model('interface', 'ImageAnnotation')
+    CompteurTemporel = apps.get_model('interface', 'CompteurTemporel')
+
+    totaux = Counter()
+    lignes = ImageAnnotation.objects.values_list('date_ajout', 'annotation', 'annotation_automatique')
+    for date_ajout, annotation, annotation_automatique in lignes.iterator():
+        locale = timezone.localtime(date_ajout)
+        heure = locale.replace(minute=0, second=0, microsecond=0)
+        jour = heure.replace(hour=0)
+        # Clés en UTC : l'heure répétée au passage à l'heure d'hiver reste distincte
+        totaux[('heure', heure.astimezone(dt_timezone.utc), annotation, annotation_automatique)] += 1
+        totaux[('jour', jour.astimezone(dt_timezone.utc), annotation, annotation_automatique)] += 1
+
+    CompteurTemporel.objects.all().delete()
+    CompteurTemporel.objects.bulk_create(
+        [
+            CompteurTemporel(
+                granularite=granularite,
+                debut=debut,
+                annotation=annotation,
+                annotation_automatique=annotation_automatique,
+                nombre=nombre,
+            )
+            for (granularite, debut, annotation, annotation_automatique), nombre in totaux.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('interface', '0003_index_traitementlot'),
+    ]
+
+    operations = [
+        migrations.RunPython(remplir_compteurs, migrations.RunPython.noop),
+    ]
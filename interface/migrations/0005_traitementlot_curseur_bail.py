@@ -0,0 +1,41 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('interface', '0004_remplir_compteurs'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='traitementlot',
+            name='image_ids',
+        ),
+        migrations.AddField(
+            model_name='traitementlot',
+            name='requete',
+            field=models.BinaryField(default=b'', editable=False, verbose_name='Requête de sélection'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='traitementlot',
+            name='pk_max',
+            field=models.BigIntegerField(default=0, verbose_name='Dernier identifiant'),
+        ),
+        migrations.AddField(
+            model_name='traitementlot',
+            name='curseur',
+            field=models.BigIntegerField(default=0, verbose_name='Dernier identifiant traité'),
+        ),
+        migrations.AddField(
+            model_name='traitementlot',
+            name='jeton',
+            field=models.CharField(blank=True, max_length=32, verbose_name="Jeton d'exécution"),
+        ),
+        migrations.AddField(
+            model_name='traitementlot',
+            name='date_maj',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Dernière activité'),
+        ),
+    ]
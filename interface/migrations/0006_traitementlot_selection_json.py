@@ -0,0 +1,40 @@
+from django.db import migrations, models
+
+
+def abandonner_traitements_non_termines(apps, schema_editor):
+    """La requête sérialisée disparaît : les traitements inachevés ne peuvent pas être repris."""
+    TraitementLot = apps.get_model('interface', 'TraitementLot')
+    TraitementLot.objects.filter(statut__in=['en_attente', 'en_cours']).update(
+        statut='echec',
+        message="Sélection non reprise après mise à jour : relancer l'action depuis la liste des images.",
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('interface', '0005_traitementlot_curseur_bail'),
+    ]
+
+    operations = [
+        migrations.RunPython(abandonner_traitements_non_termines, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='traitementlot',
+            name='requete',
+        ),
+        migrations.AddField(
+            model_name='traitementlot',
+            name='identifiants',
+            field=models.JSONField(blank=True, editable=False, null=True, verbose_name='Images cochées'),
+        ),
+        migrations.AddField(
+            model_name='traitementlot',
+            name='filtres',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Filtres'),
+        ),
+        migrations.AddField(
+            model_name='traitementlot',
+            name='recherche',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='Recherche'),
+        ),
+    ]
@@ -1,14 +1,11 @@
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 from django.db import transaction
 import os
-from PIL import Image
 import json
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import numpy as np
-import cv2
+from .classification import extraire_caracteristiques_image, classifier
+from .artefacts import TYPES_ARTEFACTS, obtenir_artefact
 from .utils import geocoder_adresse
 
 
@@ -54,13 +51,22 @@ class ImageAnnotation(models.Model):
         verbose_name = "Annotation d'image"
         verbose_name_plural = "Annotations d'images"
         ordering = ['-date_ajout']
+        # Tri, date_hierarchy et filtres de l'admin
+        indexes = [
+            models.Index(fields=['date_ajout'], name='image_date_ajout_idx'),
+            models.Index(fields=['annotation', 'date_ajout'], name='image_annotation_date_idx'),
+            models.Index(fields=['annotation_automatique', 'date_ajout'], name='image_auto_date_idx'),
+        ]
     
     def __str__(self):
         return f"Image {self.id} - {self.annotation} ({self.date_ajout.strftime('%d/%m/%Y %H:%M')})"
     
     @transaction.atomic
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)  # Sauvegarde initiale (pour accéder à self.image)
+        # Écrire le fichier avant l'analyse (comme le ferait FileField.pre_save) :
+        # une seule sauvegarde en base, donc un seul ajustement des compteurs
+        if self.image and not self.image._committed:
+            self.image.save(self.image.name, self.image.file, save=False)
 
         # Toujours re-calculer les caractéristiques pour permettre une mise à jour
         if self.image:
@@ -69,7 +75,6 @@ class ImageAnnotation(models.Model):
         # Toujours re-classer automatiquement
         self.classifier_automatiquement()
 
-        # Sauvegarde finale avec les nouvelles valeurs
         super().save(*args, **kwargs)
 
 
@@ -80,84 +85,39 @@ class ImageAnnotation(models.Model):
             return
             
         try:
-            # Taille du fichier
-            self.taille_fichier = round(self.image.size / 1024, 2)  # En Ko
-            
-            # Ouvrir l'image avec Pillow
-            with Image.open(self.image.path) as img:
-                # Dimensions
-                self.largeur, self.hauteur = img.size
-                
-                # Convertir en RGB si nécessaire
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                # Calculer la couleur moyenne
-                pixels = list(img.getdata())
-                if pixels:
-                    r_total = sum(pixel[0] for pixel in pixels)
-                    g_total = sum(pixel[1] for pixel in pixels)
-                    b_total = sum(pixel[2] for pixel in pixels)
-                    nb_pixels = len(pixels)
-                    
-                    self.couleur_moyenne_r = round(r_total / nb_pixels)
-                    self.couleur_moyenne_g = round(g_total / nb_pixels)
-                    self.couleur_moyenne_b = round(b_total / nb_pixels)
-                    
-                    # Calculer la luminance moyenne (formule standard)
-                    self.luminance_moyenne = round(
-                        0.299 * self.couleur_moyenne_r + 
-                        0.587 * self.couleur_moyenne_g + 
-                        0.114 * self.couleur_moyenne_b, 2
-                    )
-                    
-                    # Calculer le contraste (différence max-min)
-                    luminances = [0.299 * p[0] + 0.587 * p[1] + 0.114 * p[2] for p in pixels]
-                    self.contraste = round(max(luminances) - min(luminances), 2)
+            with self.image.open('rb') as fichier:
+                caracteristiques = extraire_caracteristiques_image(fichier, self.image.size)
+            for champ, valeur in caracteristiques.items():
+                setattr(self, champ, valeur)
 
-                    # Générer et sauvegarder l’histogramme RGB
-                    self._generer_histogramme_couleur()
-                    
-                    # Générer et sauvegarder l’histogramme de luminance
-                    self._generer_histogramme_luminance()
+            # En mode paresseux, les artefacts sont générés à la demande (vue artefact_image) ;
+            # en mode immédiat, on remplit dès maintenant le cache que cette vue lit
+            if settings.ARTEFACTS_MODE == 'immediat':
+                self.generer_artefacts()
 
-                    # Générer et sauvegarder les contours
-                    self._generer_contours()
-                    
         except Exception as e:
             print(f"Erreur lors de l'extraction des caractéristiques : {e}")
-    
+
+    def generer_artefacts(self):
+        """Génère dans le cache d'artefacts les rendus servis par la vue artefact_image."""
+        for type_artefact in TYPES_ARTEFACTS:
+            try:
+                obtenir_artefact(self.image.path, type_artefact)
+            except Exception as e:
+                print(f"Erreur lors de la génération de l'artefact {type_artefact} : {e}")
+
     def classifier_automatiquement(self):
-        if self.luminance_moyenne is None or self.taille_fichier is None or self.contraste is None:
+        annotation = classifier(self.luminance_moyenne, self.contraste, self.taille_fichier)
+        if annotation is None:
             print("[DEBUG] Données incomplètes : classification annulée.")
             return
-
-        if self.luminance_moyenne <= 120:
-            if self.contraste <= 254.65:
-                if self.luminance_moyenne <= 114.65:
-                    self.annotation_automatique = 'pleine'
-                    print("Arbre ajusté: lum <= 120, contraste <= 254.65, lum <= 114.65 → Pleine")
-                else:
-                    self.annotation_automatique = 'vide'
-                    print("Arbre ajusté: lum <= 120, contraste <= 254.65, lum > 114.65 → Pleine")
-            else:
-                self.annotation_automatique = 'pleine'
-                print("Arbre ajusté: lum <= 120, contraste > 254.65 → Pleine")
-        else:
-            if self.contraste <= 226.78:
-                self.annotation_automatique = 'pleine'
-                print("Arbre ajusté: lum > 120, contraste <= 226.78 → Pleine")
-            else:
-                self.annotation_automatique = 'vide'
-                print("Arbre ajusté: lum > 120, contraste > 226.78 → Vide")
+        self.annotation_automatique = annotation
 
         print(f"[DEBUG] Luminance : {self.luminance_moyenne}")
         print(f"[DEBUG] Taille fichier (Ko) : {self.taille_fichier}")
         print(f"[DEBUG] Contraste : {self.contraste}")
         print(f"[DEBUG] Annotation auto choisie : {self.annotation_automatique}")
 
-
-    
     @property
     def couleur_moyenne_hex(self):
         """Retourne la couleur moyenne en format hexadécimal"""
@@ -165,95 +125,85 @@ class ImageAnnotation(models.Model):
             return f"#{self.couleur_moyenne_r:02x}{self.couleur_moyenne_g:02x}{self.couleur_moyenne_b:02x}"
         return "#000000"
 
-    def _generer_histogramme_couleur(self, save_histograms=True):
-        """
-        Génère un histogramme RGB de l'image et le sauvegarde dans le dossier histogrammes_rgb.
-        """
-        try:
-            with Image.open(self.image.path).convert("RGB") as image:
-                np_image = np.array(image)
-
-                r = np_image[:, :, 0].flatten()
-                g = np_image[:, :, 1].flatten()
-                b = np_image[:, :, 2].flatten()
 
-                plt.figure(figsize=(8, 4))
-                plt.hist(r, bins=256, color='red', alpha=0.5, label='Rouge')
-                plt.hist(g, bins=256, color='green', alpha=0.5, label='Vert')
-                plt.hist(b, bins=256, color='blue', alpha=0.5, label='Bleu')
-                plt.title(f"Histogramme RVB - Image {self.id}")
-                plt.xlabel("Valeur de pixel")
-                plt.ylabel("Nombre de pixels")
-                plt.legend()
-                plt.tight_layout()
+class CompteurTemporel(models.Model):
+    """Compteurs agrégés par heure et par jour pour les graphiques d'évolution."""
+    GRANULARITE_CHOICES = [
+        ('heure', 'Heure'),
+        ('jour', 'Jour'),
+    ]
 
-                if save_histograms:
-                    histo_dir = os.path.join(os.path.dirname(self.image.path), "histogrammes_rgb")
-                    os.makedirs(histo_dir, exist_ok=True)
-                    histo_path = os.path.join(histo_dir, f"{os.path.splitext(os.path.basename(self.image.name))[0]}_hist.png")
-                    plt.savefig(histo_path)
-                    print(f"Histogramme RGB sauvegardé : {histo_path}")
-                else:
-                    plt.show()
-                plt.close()
-        except Exception as e:
-            print(f"Erreur lors de la génération de l'histogramme : {e}")
+    granularite = models.CharField(max_length=5, choices=GRANULARITE_CHOICES, verbose_name="Granularité")
+    debut = models.DateTimeField(verbose_name="Début de la période")
+    annotation = models.CharField(
+        max_length=20,
+        choices=ImageAnnotation.ETAT_CHOICES,
+        verbose_name="État de la poubelle"
+    )
+    annotation_automatique = models.CharField(
+        max_length=20,
+        choices=ImageAnnotation.ETAT_CHOICES,
+        verbose_name="Classification automatique"
+    )
+    nombre = models.IntegerField(default=0, verbose_name="Nombre d'images")
 
-    def _generer_histogramme_luminance(self, save_histograms=True):
-        """
-        Génère un histogramme de luminance (niveaux de gris) et le sauvegarde dans le dossier histogrammes_luminances.
-        """
-        try:
-            with Image.open(self.image.path).convert("L") as image:
-                np_image = np.array(image)
+    class Meta:
+        verbose_name = "Compteur temporel"
+        verbose_name_plural = "Compteurs temporels"
+        ordering = ['granularite', 'debut']
+        constraints = [
+            # L'index unique (granularite, debut, ...) sert aussi aux scans par plage de dates
+            models.UniqueConstraint(
+                fields=['granularite', 'debut', 'annotation', 'annotation_automatique'],
+                name='compteur_temporel_unique',
+            ),
+        ]
 
-                plt.figure(figsize=(8, 4))
-                plt.hist(np_image.flatten(), bins=256, range=(0, 255), color='gray', alpha=0.8)
-                plt.title(f'Histogramme de luminance - Image {self.id}')
-                plt.xlabel('Luminance (0 = noir, 255 = blanc)')
-                plt.ylabel('Nombre de pixels')
-                plt.grid(True)
-                plt.tight_layout()
+    def __str__(self):
+        return f"{self.granularite} {self.debut:%d/%m/%Y %H:%M} - {self.annotation}/{self.annotation_automatique} : {self.nombre}"
 
-                if save_histograms:
-                    histo_dir = os.path.join(os.path.dirname(self.image.path), "histogrammes_luminances")
-                    os.makedirs(histo_dir, exist_ok=True)
-                    histo_path = os.path.join(histo_dir, f"{os.path.splitext(os.path.basename(self.image.name))[0]}_luminance_hist.png")
-                    plt.savefig(histo_path)
-                    print(f"Histogramme de luminance sauvegardé : {histo_path}")
-                else:
-                    plt.show()
-                plt.close()
-        except Exception as e:
-            print(f"Erreur lors de la génération de l'histogramme de luminance : {e}")
 
-    def _generer_contours(self, save_contours=True):
-        """
-        Détecte les contours de l'image à l'aide de l'algorithme de Canny et les sauvegarde.
-        """
-        try:
-            image_path = self.image.path
-            image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-            if image is None:
-                print(f"Impossible de lire l'image : {self.image.name}")
-                return
+class TraitementLot(models.Model):
+    """Traitement de masse lancé depuis l'admin (ré-extraction, reclassification, géocodage)."""
+    ACTION_CHOICES = [
+        ('reextraire', 'Ré-extraire les caractéristiques'),
+        ('reclassifier', 'Reclassifier'),
+        ('regeocoder', 'Re-géocoder'),
+    ]
+    STATUT_CHOICES = [
+        ('en_attente', 'En attente'),
+        ('en_cours', 'En cours'),
+        ('termine', 'Terminé'),
+        ('echec', 'Échec'),
+    ]
 
-            edges = cv2.Canny(image, threshold1=100, threshold2=200)
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES, verbose_name="Action")
+    statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='en_attente', verbose_name="Statut")
+    # Sélection : pk cochées, ou filtres et recherche de la liste de l'admin ; bornée à
+    # pk <= pk_max et parcourue par ordre de pk à partir du curseur
+    identifiants = models.JSONField(null=True, blank=True, editable=False, verbose_name="Images cochées")
+    filtres = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Filtres")
+    recherche = models.CharField(max_length=255, blank=True, editable=False, verbose_name="Recherche")
+    pk_max = models.BigIntegerField(default=0, verbose_name="Dernier identifiant")
+    curseur = models.BigIntegerField(default=0, verbose_name="Dernier identifiant traité")
+    total = models.PositiveIntegerField(default=0, verbose_name="Total")
+    traites = models.PositiveIntegerField(default=0, verbose_name="Traités")
+    erreurs = models.PositiveIntegerField(default=0, verbose_name="Erreurs")
+    message = models.TextField(blank=True, verbose_name="Message")
+    # Bail d'exécution : le détenteur du jeton le renouvelle (date_maj) à chaque paquet
+    jeton = models.CharField(max_length=32, blank=True, verbose_name="Jeton d'exécution")
+    date_maj = models.DateTimeField(null=True, blank=True, verbose_name="Dernière activité")
+    date_creation = models.DateTimeField(default=timezone.now, verbose_name="Créé le")
+    date_fin = models.DateTimeField(null=True, blank=True, verbose_name="Terminé le")
 
-            plt.figure(figsize=(8, 6))
-            plt.imshow(edges, cmap='gray')
-            plt.title(f"Contours (Canny) - Image {self.id}")
-            plt.axis('off')
+    class Meta:
+        verbose_name = "Traitement par lot"
+        verbose_name_plural = "Traitements par lot"
+        ordering = ['-date_creation']
 
-            if save_contours:
-                contours_dir = os.path.join(os.path.dirname(image_path), "contours")
-                os.makedirs(contours_dir, exist_ok=True)
-                save_path = os.path.join(contours_dir, f"{os.path.splitext(os.path.basename(self.image.name))[0]}_contours.png")
-                cv2.imwrite(save_path, edges)
-                print(f"Contours sauvegardés : {save_path}")
-            else:
-                plt.show()
+    def __str__(self):
+        return f"{self.get_action_display()} - {self.traites}/{self.total} ({self.get_statut_display()})"
 
-            plt.close()
-        except Exception as e:
-            print(f"Erreur lors de la détection des contours : {e}")
+    @property
+    def progression(self):
+        return min(100, round(100 * self.traites / self.total)) if self.total else 100
@@ -0,0 +1,35 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import ImageAnnotation
+from .statistiques import ajuster_compteurs, variation_compteurs
+
+CHAMPS_COMPTEURS = ('date_ajout', 'annotation', 'annotation_automatique')
+
+
+@receiver(pre_save, sender=ImageAnnotation)
+def memoriser_etat_precedent(sender, instance, raw=False, **kwargs):
+    """Mémorise l'état en base avant sauvegarde pour ne corriger que la différence."""
+    if raw:
+        return
+    instance._etat_compteurs = None
+    if instance.pk:
+        instance._etat_compteurs = (
+            ImageAnnotation.objects.filter(pk=instance.pk).values_list(*CHAMPS_COMPTEURS).first()
+        )
+
+
+@receiver(post_save, sender=ImageAnnotation)
+def mettre_a_jour_compteurs(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    ancien = getattr(instance, '_etat_compteurs', None)
+    nouveau = tuple(getattr(instance, champ) for champ in CHAMPS_COMPTEURS)
+    if ancien != nouveau:
+        # Variation nette : une seule écriture même si seule l'annotation change
+        ajuster_compteurs(variation_compteurs(ancien, nouveau))
+
+
+@receiver(post_delete, sender=ImageAnnotation)
+def decrementer_compteurs(sender, instance, **kwargs):
+    ajuster_compteurs(variation_compteurs(ancien=tuple(getattr(instance, champ) for champ in CHAMPS_COMPTEURS)))
@@ -0,0 +1,168 @@
+from collections import Counter, defaultdict
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ImageAnnotation, CompteurTemporel
+
+PAS_DISPONIBLES = ('heure', 'jour', 'semaine', 'mois')
+# Colonnes de la contrainte d'unicité des compteurs, cible de l'upsert
+CHAMPS_CLE = ('granularite', 'debut', 'annotation', 'annotation_automatique')
+# Compteurs écrits par requête (5 paramètres chacun)
+TAILLE_PAQUET_COMPTEURS = 200
+
+
+def debut_heure(date):
+    """Début de l'heure locale contenant `date`."""
+    return timezone.localtime(date).replace(minute=0, second=0, microsecond=0)
+
+
+def debut_jour(date):
+    """Début du jour local contenant `date`."""
+    return timezone.localtime(date).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def debut_periode(date, pas):
+    """Début de la période (heure, jour, semaine ISO ou mois) contenant `date`."""
+    if pas == 'heure':
+        return debut_heure(date)
+    jour = debut_jour(date)
+    if pas == 'semaine':
+        return jour - timedelta(days=jour.weekday())
+    if pas == 'mois':
+        return jour.replace(day=1)
+    return jour
+
+
+def periode_suivante(debut, pas):
+    if pas == 'heure':
+        # Arithmétique en UTC pour ne pas sauter/dupliquer d'heure aux changements d'heure
+        return timezone.localtime(debut.astimezone(dt_timezone.utc) + timedelta(hours=1))
+    if pas == 'semaine':
+        return debut + timedelta(weeks=1)
+    if pas == 'mois':
+        if debut.month == 12:
+            return debut.replace(year=debut.year + 1, month=1)
+        return debut.replace(month=debut.month + 1)
+    return debut + timedelta(days=1)
+
+
+def _utc(date):
+    # Deux datetimes locaux de même fuseau se comparent à l'heure murale : l'heure répétée
+    # du passage à l'heure d'hiver ne forme qu'une clé. En UTC, les deux heures restent distinctes.
+    return date.astimezone(dt_timezone.utc)
+
+
+def _cles(date_ajout, annotation, annotation_automatique):
+    return [
+        ('heure', _utc(debut_heure(date_ajout)), annotation, annotation_automatique),
+        ('jour', _utc(debut_jour(date_ajout)), annotation, annotation_automatique),
+    ]
+
+
+def variation_compteurs(ancien=None, nouveau=None, variations=None):
+    """
+    Ajoute à `variations` (Counter) la différence de compteurs entre deux états
+    (date_ajout, annotation, annotation_automatique) d'une image ; None = absente.
+    """
+    if variations is None:
+        variations = Counter()
+    if ancien is not None:
+        for cle in _cles(*ancien):
+            variations[cle] -= 1
+    if nouveau is not None:
+        for cle in _cles(*nouveau):
+            variations[cle] += 1
+    return variations
+
+
+def ajuster_compteurs(variations):
+    """
+    Applique des variations {(granularite, debut, annotation, annotation_automatique): delta}
+    en une requête INSERT ... ON CONFLICT DO UPDATE par paquet de compteurs.
+    """
+    lignes = [(cle, delta) for cle, delta in variations.items() if delta]
+    if not lignes:
+        return
+    meta = CompteurTemporel._meta
+    champ_debut = meta.get_field('debut')
+    qn = connection.ops.quote_name
+    table = qn(meta.db_table)
+    cles = ', '.join(qn(meta.get_field(nom).column) for nom in CHAMPS_CLE)
+    nombre = qn(meta.get_field('nombre').column)
+    for i in range(0, len(lignes), TAILLE_PAQUET_COMPTEURS):
+        paquet = lignes[i:i + TAILLE_PAQUET_COMPTEURS]
+        params = []
+        for (granularite, debut, annotation, annotation_automatique), delta in paquet:
+            params += [granularite, champ_debut.get_db_prep_value(debut, connection),
+                       annotation, annotation_automatique, delta]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} ({cles}, {nombre}) "
+                f"VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(paquet))} "
+                f"ON CONFLICT ({cles}) DO UPDATE SET {nombre} = {table}.{nombre} + excluded.{nombre}",
+                params,
+            )
+
+
+@transaction.atomic
+def reconstruire_compteurs():
+    """Recalcule entièrement la table des compteurs à partir des images."""
+    totaux = Counter()
+    lignes = ImageAnnotation.objects.values_list('date_ajout', 'annotation', 'annotation_automatique')
+    for date_ajout, annotation, annotation_automatique in lignes.iterator():
+        for cle in _cles(date_ajout, annotation, annotation_automatique):
+            totaux[cle] += 1
+
+    CompteurTemporel.objects.all().delete()
+    CompteurTemporel.objects.bulk_create(
+        [
+            CompteurTemporel(
+                granularite=granularite,
+                debut=debut,
+                annotation=annotation,
+                annotation_automatique=annotation_automatique,
+                nombre=nombre,
+            )
+            for (granularite, debut, annotation, annotation_automatique), nombre in totaux.items()
+        ],
+        batch_size=1000,
+    )
+    return len(totaux)
+
+
+def serie_temporelle(debut, fin, pas='jour'):
+    """
+    Retourne l'évolution du nombre d'images entre `debut` (inclus) et `fin` (exclu),
+    regroupée par `pas`. Une seule requête par plage sur l'index des compteurs.
+    """
+    granularite = 'heure' if pas == 'heure' else 'jour'
+    debut = debut_periode(debut, pas)
+    compteurs = CompteurTemporel.objects.filter(
+        granularite=granularite,
+        debut__gte=debut,
+        debut__lt=fin,
+        nombre__gt=0,
+    ).values_list('debut', 'annotation', 'annotation_automatique', 'nombre')
+
+    buckets = defaultdict(lambda: {'total': 0, 'annotation': Counter(), 'annotation_automatique': Counter()})
+    for date, annotation, annotation_automatique, nombre in compteurs:
+        bucket = buckets[_utc(debut_periode(date, pas))]
+        bucket['total'] += nombre
+        bucket['annotation'][annotation] += nombre
+        bucket['annotation_automatique'][annotation_automatique] += nombre
+
+    etats = [code for code, _ in ImageAnnotation.ETAT_CHOICES]
+    serie = []
+    courant = debut
+    while courant < fin:
+        bucket = buckets.get(_utc(courant))
+        serie.append({
+            'periode': courant.isoformat(),
+            'total': bucket['total'] if bucket else 0,
+            'annotation': {etat: bucket['annotation'][etat] if bucket else 0 for etat in etats},
+            'annotation_automatique': {etat: bucket['annotation_automatique'][etat] if bucket else 0 for etat in etats},
+        })
+        courant = periode_suivante(courant, pas)
+    return serie
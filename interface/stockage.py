@@ -0,0 +1,86 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+# Dossiers des artefacts que l'ancien mode 'immediat' générait à côté de chaque image
+ARTEFACTS_DERIVES = (
+    ('histogrammes_rgb', '_hist.png'),
+    ('histogrammes_luminances', '_luminance_hist.png'),
+    ('contours', '_contours.png'),
+)
+
+
+def empreinte_contenu(content):
+    """SHA-256 d'un fichier Django, lu par morceaux."""
+    sha = hashlib.sha256()
+    for morceau in content.chunks():
+        sha.update(morceau)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return sha.hexdigest()
+
+
+def chemin_shard(dossier, empreinte, extension):
+    """Chemin `dossier/ab/cd/<sha256><ext>` d'un fichier adressé par son contenu."""
+    return posixpath.join(dossier, empreinte[:2], empreinte[2:4], f"{empreinte}{extension.lower()}")
+
+
+class StockageAdresseContenu(FileSystemStorage):
+    """
+    Stockage adressé par contenu : chaque fichier est rangé sous `ab/cd/<sha256>.<ext>`
+    dans le dossier `upload_to`. Deux uploads identiques partagent le même fichier.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        extension = os.path.splitext(name)[1]
+        name = chemin_shard(posixpath.dirname(name.replace('\\', '/')), empreinte_contenu(content), extension)
+        return super().save(name, content, max_length=max_length)
+
+    def get_available_name(self, name, max_length=None):
+        # Même nom = même contenu : inutile de chercher un nom libre
+        return name
+
+    def _save(self, name, content):
+        chemin = self.path(name)
+        if os.path.exists(chemin):
+            return name
+        dossier = os.path.dirname(chemin)
+        os.makedirs(dossier, exist_ok=True)
+        # Écriture atomique : un upload concurrent identique ne voit jamais de fichier partiel
+        fd, temporaire = tempfile.mkstemp(dir=dossier, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for morceau in content.chunks():
+                    f.write(morceau)
+            if self.file_permissions_mode is not None:
+                os.chmod(temporaire, self.file_permissions_mode)
+            os.replace(temporaire, chemin)
+        except BaseException:
+            if os.path.exists(temporaire):
+                os.remove(temporaire)
+            raise
+        return name
+
+
+class StockageStatiqueCompresse(CompressedManifestStaticFilesStorage):
+    """
+    Statiques hachés et précompressés ; un fichier absent du manifest et de STATIC_ROOT
+    (tests, collectstatic pas encore lancé) est référencé sous son nom d'origine au lieu de
+    lever une ValueError au rendu des gabarits.
+    """
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
@@ -0,0 +1,417 @@
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import BytesIO, StringIO
+
+from PIL import Image
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+
+class BudgetImportTests(SimpleTestCase):
+    def test_demarrage_dans_le_budget(self):
+        # Échoue (CommandError) si le démarrage charge une dépendance lourde ou dépasse le budget
+        call_command('budget_import', stdout=StringIO())
+
+
+def _extraction_reference(img, taille_octets):
+    """Calcul pixel par pixel d'origine (avant le passage à NumPy)."""
+    resultat = {'taille_fichier': round(taille_octets / 1024, 2)}
+    resultat['largeur'], resultat['hauteur'] = img.size
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    pixels = list(img.getdata())
+    nb_pixels = len(pixels)
+    resultat['couleur_moyenne_r'] = round(sum(p[0] for p in pixels) / nb_pixels)
+    resultat['couleur_moyenne_g'] = round(sum(p[1] for p in pixels) / nb_pixels)
+    resultat['couleur_moyenne_b'] = round(sum(p[2] for p in pixels) / nb_pixels)
+    resultat['luminance_moyenne'] = round(
+        0.299 * resultat['couleur_moyenne_r'] +
+        0.587 * resultat['couleur_moyenne_g'] +
+        0.114 * resultat['couleur_moyenne_b'], 2
+    )
+    luminances = [0.299 * p[0] + 0.587 * p[1] + 0.114 * p[2] for p in pixels]
+    resultat['contraste'] = round(max(luminances) - min(luminances), 2)
+    return resultat
+
+
+def _arbre_reference(luminance, contraste):
+    """Arbre de décision d'origine de ImageAnnotation.classifier_automatiquement."""
+    if luminance <= 120:
+        if contraste <= 254.65:
+            return 'pleine' if luminance <= 114.65 else 'vide'
+        return 'pleine'
+    return 'pleine' if contraste <= 226.78 else 'vide'
+
+
+class ClassificationTests(SimpleTestCase):
+    def _images_synthetiques(self):
+        import random
+        from PIL import Image, ImageDraw
+
+        aleatoire = random.Random(42)
+        images = [
+            Image.new('RGB', (32, 24), (0, 0, 0)),
+            Image.new('RGB', (17, 9), (255, 255, 255)),
+            Image.new('L', (20, 20), 117),
+            Image.new('RGBA', (10, 30), (10, 200, 30, 128)),
+        ]
+        for _ in range(4):
+            img = Image.new('RGB', (64, 48), tuple(aleatoire.randint(0, 255) for _ in range(3)))
+            dessin = ImageDraw.Draw(img)
+            for _ in range(10):
+                x, y = aleatoire.randint(0, 60), aleatoire.randint(0, 44)
+                dessin.rectangle([x, y, x + 8, y + 8], fill=tuple(aleatoire.randint(0, 255) for _ in range(3)))
+            images.append(img)
+        return images
+
+    def test_extraction_identique_au_calcul_pixel_par_pixel(self):
+        from interface.classification import extraire_caracteristiques_image
+
+        for img in self._images_synthetiques():
+            buf = BytesIO()
+            img.save(buf, format='PNG')
+            buf.seek(0)
+            with Image.open(BytesIO(buf.getvalue())) as relue:
+                attendu = _extraction_reference(relue, len(buf.getvalue()))
+            self.assertEqual(extraire_caracteristiques_image(buf, len(buf.getvalue())), attendu)
+
+    def test_classifier_lot_conforme_a_classifier_et_a_l_arbre(self):
+        from interface.classification import classifier, classifier_lot
+
+        luminances = [0, 114.64, 114.65, 114.66, 119.99, 120, 120.01, 200, None]
+        contrastes = [0, 226.77, 226.78, 226.79, 254.64, 254.65, 254.66, 255, None]
+        vecteurs = [(l, c, t) for l in luminances for c in contrastes for t in (12.5, None)]
+
+        attendus = [classifier(l, c, t) for l, c, t in vecteurs]
+        self.assertEqual(classifier_lot(*zip(*vecteurs)), attendus)
+        for (l, c, t), attendu in zip(vecteurs, attendus):
+            if l is None or c is None or t is None:
+                self.assertIsNone(attendu)
+            else:
+                self.assertEqual(attendu, _arbre_reference(l, c))
+
+
+def _fichier_image(nom='photo.png', couleur=(90, 90, 90)):
+    buf = BytesIO()
+    Image.new('RGB', (16, 16), couleur).save(buf, format='PNG')
+    return SimpleUploadedFile(nom, buf.getvalue(), content_type='image/png')
+
+
+class MediaTemporaireMixin:
+    """MEDIA_ROOT et cache d'artefacts dans un dossier temporaire supprimé après la classe."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dossier_media = tempfile.mkdtemp(prefix='wdp_tests_')
+        cls.reglages_media = override_settings(MEDIA_ROOT=cls.dossier_media)
+        cls.reglages_media.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.reglages_media.disable()
+        shutil.rmtree(cls.dossier_media, ignore_errors=True)
+
+
+class CompteurTemporelTests(MediaTemporaireMixin, TestCase):
+    def _compteurs(self):
+        from interface.models import CompteurTemporel
+
+        return {
+            (c.granularite, c.debut, c.annotation, c.annotation_automatique): c.nombre
+            for c in CompteurTemporel.objects.filter(nombre__gt=0)
+        }
+
+    def _reconstruits(self):
+        from interface.statistiques import reconstruire_compteurs
+
+        reconstruire_compteurs()
+        return self._compteurs()
+
+    def test_variation_nette(self):
+        from interface.statistiques import variation_compteurs
+
+        date = datetime(2024, 5, 2, 10, 15, tzinfo=dt_timezone.utc)
+        self.assertFalse(any(variation_compteurs((date, 'vide', 'pleine'), (date, 'vide', 'pleine')).values()))
+        variations = variation_compteurs((date, 'non_annotee', 'pleine'), (date, 'vide', 'pleine'))
+        self.assertEqual(sorted(variations.values()), [-1, -1, 1, 1])
+        self.assertEqual({cle[0] for cle in variations}, {'heure', 'jour'})
+
+    def test_compteurs_suivent_creation_annotation_et_suppression(self):
+        from interface.models import ImageAnnotation
+
+        image = ImageAnnotation(image=_fichier_image(), date_ajout=datetime(2024, 5, 2, 10, 15, tzinfo=dt_timezone.utc))
+        image.save()
+        compteurs = self._compteurs()
+        self.assertEqual(len(compteurs), 2)
+        self.assertEqual(set(compteurs.values()), {1})
+        self.assertEqual(compteurs, self._reconstruits())
+
+        image.annotation = 'vide'
+        with CaptureQueriesContext(connection) as requetes:
+            image.save()
+        ecritures = [q['sql'] for q in requetes.captured_queries
+                     if 'interface_compteurtemporel' in q['sql']]
+        self.assertEqual(len(ecritures), 1)
+        self.assertEqual({cle[2] for cle in self._compteurs()}, {'vide'})
+        self.assertEqual(self._compteurs(), self._reconstruits())
+
+        image.delete()
+        self.assertEqual(self._compteurs(), {})
+
+    def test_compteurs_du_lot_api(self):
+        from interface.models import ImageAnnotation
+        from interface.statistiques import reconstruire_compteurs
+
+        fichiers = [_fichier_image(f"lot{i}.png", (i * 40, 90, 200 - i * 40)) for i in range(3)]
+        reponse = self.client.post('/api/classifier/', {'images': fichiers, 'enregistrer': '1'})
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(ImageAnnotation.objects.count(), 3)
+        compteurs = self._compteurs()
+        reconstruire_compteurs()
+        self.assertEqual(compteurs, self._compteurs())
+
+
+class SerieTemporelleTests(TestCase):
+    """Buckets aux changements d'heure (Europe/Paris)."""
+
+    def _ajouter(self, *dates):
+        from interface.statistiques import ajuster_compteurs, variation_compteurs
+
+        variations = None
+        for date in dates:
+            variations = variation_compteurs(nouveau=(date, 'pleine', 'pleine'), variations=variations)
+        ajuster_compteurs(variations)
+
+    @override_settings(TIME_ZONE='Europe/Paris')
+    def test_heure_d_ete(self):
+        from interface.statistiques import debut_jour, serie_temporelle
+
+        debut = debut_jour(datetime(2024, 3, 31, 12, tzinfo=dt_timezone.utc))
+        fin = debut_jour(datetime(2024, 4, 1, 12, tzinfo=dt_timezone.utc))
+        # 01:30 UTC = 03:30 heure d'été, juste après le saut de 02:00 à 03:00
+        self._ajouter(datetime(2024, 3, 31, 1, 30, tzinfo=dt_timezone.utc))
+
+        heures = serie_temporelle(debut, fin, 'heure')
+        self.assertEqual(len(heures), 23)
+        self.assertEqual([h['total'] for h in heures].index(1), 2)
+        self.assertTrue(heures[2]['periode'].startswith('2024-03-31T03:00:00+02:00'))
+        jours = serie_temporelle(debut, fin, 'jour')
+        self.assertEqual([j['total'] for j in jours], [1])
+        self.assertEqual(fin.astimezone(dt_timezone.utc) - debut.astimezone(dt_timezone.utc), timedelta(hours=23))
+
+    @override_settings(TIME_ZONE='Europe/Paris')
+    def test_heure_d_hiver(self):
+        from interface.statistiques import debut_jour, serie_temporelle
+
+        debut = debut_jour(datetime(2024, 10, 27, 12, tzinfo=dt_timezone.utc))
+        fin = debut_jour(datetime(2024, 10, 28, 12, tzinfo=dt_timezone.utc))
+        # 02:30 locale deux fois : +02:00 (00:30 UTC) puis +01:00 (01:30 UTC)
+        self._ajouter(
+            datetime(2024, 10, 27, 0, 30, tzinfo=dt_timezone.utc),
+            datetime(2024, 10, 27, 1, 30, tzinfo=dt_timezone.utc),
+        )
+
+        heures = serie_temporelle(debut, fin, 'heure')
+        self.assertEqual(len(heures), 25)
+        doublees = [h for h in heures if h['periode'][11:19] == '02:00:00']
+        self.assertEqual([h['periode'][-6:] for h in doublees], ['+02:00', '+01:00'])
+        self.assertEqual([h['total'] for h in doublees], [1, 1])
+        self.assertEqual([j['total'] for j in serie_temporelle(debut, fin, 'jour')], [2])
+
+
+def _obtenir_avec_compteur(dossier, compteur):
+    """Cible des processus de test : rend un artefact en journalisant chaque rendu effectif."""
+    import time
+    from interface.artefacts import CacheArtefacts
+
+    def rendu():
+        with open(compteur, 'a') as f:
+            f.write('rendu\n')
+        time.sleep(0.2)
+        return b'png'
+
+    CacheArtefacts(dossier, 1024 * 1024).obtenir('ab' * 32 + '_miniature_v1', rendu)
+
+
+class ArtefactsTests(MediaTemporaireMixin, TestCase):
+    def setUp(self):
+        from unittest import mock
+        from interface.artefacts import cache_artefacts
+
+        dossier_cache = tempfile.mkdtemp(dir=self.dossier_media)
+        patch = mock.patch.object(cache_artefacts, 'dossier', dossier_cache)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    @override_settings(ARTEFACTS_MODE='immediat')
+    def test_mode_immediat_remplit_le_cache_servi_par_la_vue(self):
+        from interface.artefacts import TYPES_ARTEFACTS, cache_artefacts, cle_artefact
+        from interface.models import ImageAnnotation
+
+        image = ImageAnnotation(image=_fichier_image())
+        image.save()
+        for type_artefact in TYPES_ARTEFACTS:
+            chemin = cache_artefacts.chemin(cle_artefact(image.image.path, type_artefact))
+            self.assertTrue(os.path.exists(chemin), type_artefact)
+
+        reponse = self.client.get(f'/images/{image.pk}/miniature.png')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertIn('max-age', reponse['Cache-Control'])
+        reponse = self.client.get(f'/images/{image.pk}/miniature.png', HTTP_IF_NONE_MATCH=reponse['ETag'])
+        self.assertEqual(reponse.status_code, 304)
+
+    def test_rendus_regroupes_entre_processus(self):
+        import multiprocessing
+        from interface import artefacts
+
+        if artefacts.fcntl is None:
+            self.skipTest("Verrous de fichiers indisponibles sur cette plateforme")
+        dossier = tempfile.mkdtemp(dir=self.dossier_media)
+        compteur = os.path.join(dossier, 'rendus.log')
+        contexte = multiprocessing.get_context('fork')
+        processus = [contexte.Process(target=_obtenir_avec_compteur, args=(dossier, compteur)) for _ in range(4)]
+        for p in processus:
+            p.start()
+        for p in processus:
+            p.join(timeout=30)
+            self.assertEqual(p.exitcode, 0)
+        with open(compteur) as f:
+            self.assertEqual(len(f.readlines()), 1)
+
+
+class PagesTests(MediaTemporaireMixin, TestCase):
+    def test_pages_rendues_sans_manifest_des_statiques(self):
+        # Le lanceur de tests force DEBUG=False : base.html passe par le stockage des statiques
+        from interface.models import ImageAnnotation
+
+        image = ImageAnnotation(image=_fichier_image())
+        image.save()
+        for url in ('/', '/upload/', '/images/', f'/annoter/{image.pk}/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class MigrerStockageTests(MediaTemporaireMixin, TestCase):
+    def _image_legacy(self, nom, couleur):
+        from interface.models import ImageAnnotation
+
+        chemin = os.path.join(self.dossier_media, nom)
+        os.makedirs(os.path.dirname(chemin), exist_ok=True)
+        Image.new('RGB', (8, 8), couleur).save(chemin, format='JPEG')
+        return ImageAnnotation(image=nom)
+
+    def test_fichier_partage_entre_lots(self):
+        from interface.models import ImageAnnotation
+        from interface.stockage import chemin_shard, empreinte_contenu
+        from django.core.files import File
+
+        # bulk_create : lignes à l'ancien format, sans passer par save() ni le stockage
+        partagee = self._image_legacy('poubelles/vieux.jpg', (10, 20, 30))
+        ImageAnnotation.objects.bulk_create([
+            partagee,
+            self._image_legacy('poubelles/autre.jpg', (200, 100, 50)),
+            ImageAnnotation(image='poubelles/vieux.jpg'),
+        ])
+        with open(os.path.join(self.dossier_media, 'poubelles/vieux.jpg'), 'rb') as f:
+            attendu = chemin_shard('poubelles', empreinte_contenu(File(f)), '.jpg')
+
+        sortie, erreurs = StringIO(), StringIO()
+        call_command('migrer_stockage', batch_size=1, stdout=sortie, stderr=erreurs)
+
+        self.assertEqual(erreurs.getvalue(), '')
+        self.assertIn('3 image(s) migrée(s), 0 déjà en place', sortie.getvalue())
+        noms = list(ImageAnnotation.objects.order_by('pk').values_list('image', flat=True))
+        self.assertEqual(noms[0], attendu)
+        self.assertEqual(noms[2], attendu)
+        self.assertRegex(noms[1], r'^poubelles/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        for nom in noms:
+            self.assertTrue(os.path.isfile(os.path.join(self.dossier_media, nom)))
+        self.assertFalse(os.path.exists(os.path.join(self.dossier_media, 'poubelles/vieux.jpg')))
+
+    def test_dry_run(self):
+        from interface.models import ImageAnnotation
+
+        ImageAnnotation.objects.bulk_create([self._image_legacy('poubelles/essai.jpg', (5, 5, 5))])
+        call_command('migrer_stockage', dry_run=True, stdout=StringIO())
+        self.assertEqual(ImageAnnotation.objects.get().image.name, 'poubelles/essai.jpg')
+        self.assertTrue(os.path.isfile(os.path.join(self.dossier_media, 'poubelles/essai.jpg')))
+
+
+class TraitementLotTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from interface.models import ImageAnnotation
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'mdp'))
+        # bulk_create : ni fichier ni extraction, seules les caractéristiques comptent ici
+        self.images = ImageAnnotation.objects.bulk_create([
+            ImageAnnotation(image=f'poubelles/{nom}.jpg', localisation=nom, annotation=annotation,
+                            luminance_moyenne=200, contraste=250, taille_fichier=10)
+            for nom, annotation in [('Paris Nord', 'vide'), ('Lyon', 'vide'), ('Paris Sud', 'pleine')]
+        ])
+
+    def _action(self, parametres, **donnees):
+        with self.captureOnCommitCallbacks(execute=False):
+            reponse = self.client.post(
+                f'/admin/interface/imageannotation/?{parametres}',
+                {'action': 'action_reclassifier', 'index': 0, **donnees},
+            )
+        self.assertEqual(reponse.status_code, 302)
+        from interface.models import TraitementLot
+        return TraitementLot.objects.get()
+
+    def test_tous_les_resultats_enregistre_filtres_et_recherche(self):
+        from interface.traitements import executer_traitement
+
+        traitement = self._action(
+            'annotation__exact=vide&q=Paris', select_across='1', _selected_action=[self.images[0].pk],
+        )
+        self.assertIsNone(traitement.identifiants)
+        self.assertEqual(traitement.filtres, {'annotation__exact': ['vide']})
+        self.assertEqual(traitement.recherche, 'Paris')
+        self.assertEqual(traitement.total, 1)
+
+        self.assertTrue(executer_traitement(traitement.pk))
+        traitement.refresh_from_db()
+        self.assertEqual((traitement.statut, traitement.traites, traitement.curseur),
+                         ('termine', 1, self.images[0].pk))
+        self.images[0].refresh_from_db()
+        self.assertEqual(self.images[0].annotation_automatique, 'vide')
+
+    def test_images_cochees(self):
+        traitement = self._action('', select_across='0', _selected_action=[self.images[1].pk, self.images[2].pk])
+        self.assertEqual(sorted(traitement.identifiants), [self.images[1].pk, self.images[2].pk])
+        self.assertEqual(traitement.total, 2)
+
+    def test_reprise_seulement_apres_expiration_du_bail(self):
+        from django.utils import timezone
+        from interface.models import TraitementLot
+        from interface.traitements import DUREE_BAIL, executer_traitement, traitements_a_reprendre
+
+        traitement = TraitementLot.objects.create(
+            action='reclassifier', statut='en_cours', jeton='autre', date_maj=timezone.now(),
+            identifiants=[self.images[0].pk], pk_max=self.images[0].pk, total=1,
+        )
+        self.assertEqual(traitements_a_reprendre(), [])
+        self.assertFalse(executer_traitement(traitement.pk))
+
+        TraitementLot.objects.filter(pk=traitement.pk).update(date_maj=timezone.now() - DUREE_BAIL * 2)
+        self.assertEqual(traitements_a_reprendre(), [traitement.pk])
+        self.assertTrue(executer_traitement(traitement.pk))
+        traitement.refresh_from_db()
+        self.assertEqual(traitement.statut, 'termine')
+
+    def test_consulter_les_traitements_ne_relance_rien(self):
+        from unittest import mock
+
+        with mock.patch('interface.traitements._demarrer') as demarrer:
+            self.assertEqual(self.client.get('/admin/interface/traitementlot/').status_code, 200)
+        demarrer.assert_not_called()
@@ -0,0 +1,211 @@
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.admin.utils import prepare_lookup_value
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Max, Q
+from django.utils import timezone
+from django.utils.text import smart_split, unescape_string_literal
+
+from .classification import CHAMPS_CARACTERISTIQUES, classifier_lot
+from .models import ImageAnnotation, TraitementLot
+from .statistiques import ajuster_compteurs, variation_compteurs
+from .utils import geocoder_adresse
+
+# Nombre d'images chargées et mises à jour par requête
+TAILLE_PAQUET = 100
+# Politique d'usage de Nominatim : une requête par seconde au plus
+PAUSE_GEOCODAGE = 1.0
+# Sans activité pendant cette durée, un traitement « en cours » est considéré abandonné
+# (largement au-dessus de la durée d'un paquet, géocodage compris)
+DUREE_BAIL = timedelta(minutes=10)
+# Champs de recherche de la liste des images dans l'admin
+CHAMPS_RECHERCHE = ('localisation',)
+
+
+def _mettre_a_jour(images, champs, anciennes_annotations=None):
+    """Écrit les champs modifiés en un UPDATE groupé et corrige les compteurs temporels."""
+    with transaction.atomic():
+        ImageAnnotation.objects.bulk_update(images, champs)
+        if anciennes_annotations is None:
+            return
+        # bulk_update ne déclenche pas les signaux : compteurs corrigés ici, en une écriture
+        variations = Counter()
+        for image, ancienne in zip(images, anciennes_annotations):
+            if image.annotation_automatique != ancienne:
+                variation_compteurs(
+                    (image.date_ajout, image.annotation, ancienne),
+                    (image.date_ajout, image.annotation, image.annotation_automatique),
+                    variations,
+                )
+        ajuster_compteurs(variations)
+
+
+def _reextraire(images):
+    anciennes = [image.annotation_automatique for image in images]
+    for image in images:
+        image.extraire_caracteristiques()
+        image.classifier_automatiquement()
+    _mettre_a_jour(images, [*CHAMPS_CARACTERISTIQUES, 'annotation_automatique'], anciennes)
+    return sum(1 for image in images if image.luminance_moyenne is None)
+
+
+def _reclassifier(images):
+    anciennes = [image.annotation_automatique for image in images]
+    annotations = classifier_lot(
+        [image.luminance_moyenne for image in images],
+        [image.contraste for image in images],
+        [image.taille_fichier for image in images],
+    )
+    for image, annotation in zip(images, annotations):
+        if annotation is not None:
+            image.annotation_automatique = annotation
+    _mettre_a_jour(images, ['annotation_automatique'], anciennes)
+    return annotations.count(None)
+
+
+def _regeocoder(images):
+    erreurs = 0
+    for image in images:
+        if not image.localisation:
+            continue
+        lat, lon = geocoder_adresse(image.localisation)
+        if lat and lon:
+            image.latitude, image.longitude = lat, lon
+        else:
+            erreurs += 1
+        time.sleep(PAUSE_GEOCODAGE)
+    _mettre_a_jour(images, ['latitude', 'longitude'])
+    return erreurs
+
+
+OPERATIONS = {
+    'reextraire': _reextraire,
+    'reclassifier': _reclassifier,
+    'regeocoder': _regeocoder,
+}
+
+
+def selection_images(identifiants=None, filtres=None, recherche=''):
+    """
+    Images visées par un traitement, décrites par des données simples (JSON) :
+    - `identifiants` : liste des pk cochées dans la liste de l'admin ;
+    - sinon `filtres` ({paramètre: [valeurs]} des filtres de la liste) et `recherche`,
+      appliqués comme le fait l'admin (« Sélectionner tous les résultats »).
+    """
+    queryset = ImageAnnotation.objects.all()
+    if identifiants is not None:
+        return queryset.filter(pk__in=identifiants)
+    for parametre, valeurs in (filtres or {}).items():
+        condition = Q()
+        for valeur in valeurs:
+            condition |= Q(**{parametre: prepare_lookup_value(parametre, valeur)})
+        queryset = queryset.filter(condition)
+    for terme in smart_split(recherche):
+        if terme.startswith(('"', "'")) and terme[0] == terme[-1]:
+            terme = unescape_string_literal(terme)
+        condition = Q()
+        for champ in CHAMPS_RECHERCHE:
+            condition |= Q(**{f"{champ}__icontains": terme})
+        queryset = queryset.filter(condition)
+    return queryset
+
+
+def _requete_selection(traitement):
+    return selection_images(traitement.identifiants, traitement.filtres, traitement.recherche).filter(
+        pk__lte=traitement.pk_max
+    ).order_by('pk')
+
+
+def reserver_traitement(traitement_id):
+    """
+    Réserve un traitement en attente, ou abandonné (bail expiré), de façon atomique.
+    Retourne le jeton d'exécution, ou None si un autre exécuteur le détient.
+    """
+    maintenant = timezone.now()
+    jeton = uuid.uuid4().hex
+    reserves = TraitementLot.objects.filter(pk=traitement_id).filter(
+        Q(statut='en_attente') | Q(statut='en_cours', date_maj__lt=maintenant - DUREE_BAIL)
+    ).update(statut='en_cours', jeton=jeton, date_maj=maintenant)
+    return jeton if reserves else None
+
+
+def executer_traitement(traitement_id):
+    """
+    Exécute (ou reprend à partir du curseur) un traitement par paquets en publiant la
+    progression en base. Retourne False si le traitement est détenu par un autre exécuteur.
+    """
+    jeton = reserver_traitement(traitement_id)
+    if jeton is None:
+        return False
+    traitement = TraitementLot.objects.get(pk=traitement_id)
+    # Toutes les écritures vérifient le jeton : un exécuteur ayant perdu son bail s'arrête
+    suivi = TraitementLot.objects.filter(pk=traitement_id, jeton=jeton)
+    operation = OPERATIONS[traitement.action]
+    selection = _requete_selection(traitement)
+    curseur = traitement.curseur
+    try:
+        while True:
+            images = list(selection.filter(pk__gt=curseur)[:TAILLE_PAQUET])
+            if not images:
+                break
+            erreurs = operation(images)
+            curseur = images[-1].pk
+            if not suivi.update(
+                curseur=curseur,
+                traites=F('traites') + len(images),
+                erreurs=F('erreurs') + erreurs,
+                date_maj=timezone.now(),
+            ):
+                return False
+        suivi.update(statut='termine', date_fin=timezone.now(), date_maj=timezone.now())
+    except Exception as e:
+        suivi.update(statut='echec', message=str(e), date_fin=timezone.now())
+        raise
+    return True
+
+
+def _executer_en_arriere_plan(traitement_id):
+    close_old_connections()
+    try:
+        executer_traitement(traitement_id)
+    except Exception as e:
+        print(f"[TRAITEMENT] Échec du traitement {traitement_id} : {e}")
+    finally:
+        connection.close()
+
+
+def _demarrer(traitement_id):
+    threading.Thread(target=_executer_en_arriere_plan, args=(traitement_id,), daemon=True).start()
+
+
+def traitements_a_reprendre():
+    """Identifiants des traitements en attente ou dont le bail a expiré (worker arrêté)."""
+    limite = timezone.now() - DUREE_BAIL
+    return list(
+        TraitementLot.objects.filter(
+            Q(statut='en_attente', date_creation__lt=limite) | Q(statut='en_cours', date_maj__lt=limite)
+        ).order_by('date_creation').values_list('pk', flat=True)
+    )
+
+
+def lancer_traitement(action, identifiants=None, filtres=None, recherche=''):
+    """
+    Crée un traitement sur la sélection (voir `selection_images`) et l'exécute dans un thread
+    une fois la transaction validée. Les traitements abandonnés sont repris par la commande
+    `executer_traitements`.
+    """
+    selection = selection_images(identifiants, filtres, recherche).order_by()
+    traitement = TraitementLot.objects.create(
+        action=action,
+        identifiants=identifiants,
+        filtres=filtres or {},
+        recherche=recherche,
+        pk_max=selection.aggregate(dernier=Max('pk'))['dernier'] or 0,
+        total=selection.count(),
+    )
+    transaction.on_commit(lambda: _demarrer(traitement.pk))
+    return traitement
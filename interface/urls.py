@@ -6,7 +6,10 @@ urlpatterns = [
     path('upload/', views.upload_image, name='upload_image'),
     path('annoter/<int:image_id>/', views.annoter_image, name='annoter_image'),
     path('images/', views.liste_images, name='liste_images'),
+    path('images/<int:image_id>/<str:type_artefact>.png', views.artefact_image, name='artefact_image'),
     path('api/stats/', views.api_stats, name='api_stats'),
+    path('api/evolution/', views.api_evolution, name='api_evolution'),
+    path('api/classifier/', views.api_classifier, name='api_classifier'),
     path('graphique-statique/', views.stats_plot, name='graphique_statique'),
     path('metrics/', views.metrics_view, name='metrics'),
 ]
@@ -1,6 +1,6 @@
-from geopy.geocoders import Nominatim
-
 def geocoder_adresse(adresse):
+    from geopy.geocoders import Nominatim
+
     geolocator = Nominatim(user_agent="geoapi")
     try:
         location = geolocator.geocode(adresse)
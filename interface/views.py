@@ -1,20 +1,32 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, FileResponse, Http404, HttpResponseBadRequest
 from django.db.models import Count, Q, Avg, Sum, Max, Min
 from django.core.paginator import Paginator
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_POST, require_safe
+from django.utils import timezone
 from .models import ImageAnnotation
 from .forms import ImageUploadForm, AnnotationForm
-from datetime import datetime, timedelta
-from geopy.geocoders import Nominatim
+from .artefacts import TYPES_ARTEFACTS, SEUILS_CANNY_DEFAUT, obtenir_artefact, cle_artefact
+from .classification import extraire_caracteristiques_image, classifier_lot
+from .statistiques import PAS_DISPONIBLES, ajuster_compteurs, debut_jour, serie_temporelle, variation_compteurs
+from datetime import datetime, timedelta, timezone as dt_timezone
 from .utils import geocoder_adresse
-import matplotlib.pyplot as plt
 from io import BytesIO
 import json
+import mimetypes
+import os
+import time
 from math import radians, sin, cos, sqrt, atan2
 from collections import deque
-from collections import defaultdict
-from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
+from collections import Counter, defaultdict
 
 def upload_image(request):
     if request.method == 'POST':
@@ -68,12 +80,13 @@ def dashboard(request):
     date_limite = datetime.now() - timedelta(days=7)
     images_recentes = ImageAnnotation.objects.filter(date_ajout__gte=date_limite).count()
 
+    aujourd_hui = debut_jour(timezone.now())
     evolution_data = [
         {
-            'date': (datetime.now() - timedelta(days=i)).strftime('%d/%m'),
-            'count': ImageAnnotation.objects.filter(date_ajout__date=(datetime.now() - timedelta(days=i)).date()).count()
+            'date': datetime.fromisoformat(point['periode']).strftime('%d/%m'),
+            'count': point['total'],
         }
-        for i in range(6, -1, -1)
+        for point in serie_temporelle(aujourd_hui - timedelta(days=6), aujourd_hui + timedelta(days=1))
     ]
 
     images_list = ImageAnnotation.objects.all()
@@ -241,6 +254,207 @@ def api_stats(request):
     }
     return JsonResponse(stats)
 
+# Plages maximales servies par api_evolution, en jours
+JOURS_MAX = {'heure': 31, 'jour': 366 * 2, 'semaine': 366 * 5, 'mois': 366 * 10}
+
+def api_evolution(request):
+    """
+    Évolution du nombre d'images sur une plage arbitraire, lue dans les compteurs agrégés.
+    Paramètres : `pas` (heure, jour, semaine, mois), `jours` ou `debut`/`fin` (AAAA-MM-JJ).
+    """
+    pas = request.GET.get('pas', 'jour')
+    if pas not in PAS_DISPONIBLES:
+        return JsonResponse({'erreur': f"Pas inconnu : {pas}"}, status=400)
+
+    try:
+        if request.GET.get('debut'):
+            debut = timezone.make_aware(datetime.strptime(request.GET['debut'], '%Y-%m-%d'))
+            fin_param = request.GET.get('fin')
+            fin = timezone.make_aware(datetime.strptime(fin_param, '%Y-%m-%d')) if fin_param else timezone.now()
+            fin = debut_jour(fin) + timedelta(days=1)
+        else:
+            jours = int(request.GET.get('jours', 30))
+            if jours < 1:
+                raise ValueError
+            # Vérifié avant tout calcul de date : une valeur énorme déborderait timedelta
+            if jours > JOURS_MAX[pas]:
+                return JsonResponse({'erreur': f"Plage trop longue pour le pas « {pas} » ({JOURS_MAX[pas]} jours max)."}, status=400)
+            fin = debut_jour(timezone.now()) + timedelta(days=1)
+            debut = fin - timedelta(days=jours)
+    except (ValueError, OverflowError):
+        return JsonResponse({'erreur': "Paramètres de plage invalides."}, status=400)
+
+    if debut >= fin:
+        return JsonResponse({'erreur': "La date de début doit précéder la date de fin."}, status=400)
+    if fin - debut > timedelta(days=JOURS_MAX[pas]):
+        return JsonResponse({'erreur': f"Plage trop longue pour le pas « {pas} » ({JOURS_MAX[pas]} jours max)."}, status=400)
+
+    return JsonResponse({
+        'pas': pas,
+        'debut': debut.isoformat(),
+        'fin': fin.isoformat(),
+        'serie': serie_temporelle(debut, fin, pas),
+    })
+
+def _ouvrir_artefact(chemin_image, type_artefact, params):
+    """Ouvre le PNG de l'artefact, ou None si sa génération échoue."""
+    # L'artefact peut être évincé entre sa génération et son ouverture : une seconde tentative le régénère
+    for _ in range(2):
+        try:
+            return open(obtenir_artefact(chemin_image, type_artefact, **params), 'rb')
+        except FileNotFoundError:
+            continue
+        except ValueError:
+            break
+    return None
+
+
+def artefact_image(request, image_id, type_artefact):
+    """
+    Sert un artefact dérivé (histogrammes, contours) depuis le cache disque,
+    en le générant à la première demande. Contours : `seuil_bas`, `seuil_haut`.
+    """
+    if type_artefact not in TYPES_ARTEFACTS:
+        raise Http404("Artefact inconnu")
+    image_annotation = get_object_or_404(ImageAnnotation, id=image_id)
+    if not image_annotation.image:
+        raise Http404("Image absente")
+
+    params = {}
+    if type_artefact == 'contours':
+        try:
+            seuil_bas = int(request.GET.get('seuil_bas', SEUILS_CANNY_DEFAUT[0]))
+            seuil_haut = int(request.GET.get('seuil_haut', SEUILS_CANNY_DEFAUT[1]))
+        except ValueError:
+            return HttpResponseBadRequest("Seuils invalides.")
+        if not (0 <= seuil_bas <= seuil_haut <= 1000):
+            return HttpResponseBadRequest("Seuils hors limites (0 <= seuil_bas <= seuil_haut <= 1000).")
+        params = {'seuil_bas': seuil_bas, 'seuil_haut': seuil_haut}
+
+    # La clé (empreinte du contenu + paramètres) sert d'ETag : 304 sans rendu ni lecture
+    try:
+        etag = f'"{cle_artefact(image_annotation.image.path, type_artefact, **params)}"'
+    except (FileNotFoundError, ValueError):
+        raise Http404("Impossible de générer l'artefact")
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        fichier = _ouvrir_artefact(image_annotation.image.path, type_artefact, params)
+        if fichier is None:
+            raise Http404("Impossible de générer l'artefact")
+        response = FileResponse(fichier, content_type='image/png')
+    response.headers['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=settings.MEDIA_CACHE_MAX_AGE)
+    return response
+
+def _enregistrer_lot(elements):
+    """Enregistre les images classées en un seul INSERT groupé, sans passer par save()."""
+    champ_image = ImageAnnotation._meta.get_field('image')
+    instances = []
+    for element in elements:
+        fichier = element.pop('_fichier')
+        nom = default_storage.save(champ_image.generate_filename(None, fichier.name), fichier)
+        instances.append(ImageAnnotation(
+            image=nom,
+            annotation_automatique=element['annotation_automatique'] or 'non_annotee',
+            **element['caracteristiques'],
+        ))
+    with transaction.atomic():
+        ImageAnnotation.objects.bulk_create(instances)
+        # bulk_create ne déclenche pas les signaux : compteurs mis à jour ici, en une écriture
+        variations = Counter()
+        for instance in instances:
+            variation_compteurs(
+                nouveau=(instance.date_ajout, instance.annotation, instance.annotation_automatique),
+                variations=variations,
+            )
+        ajuster_compteurs(variations)
+    for element, instance in zip(elements, instances):
+        element['id'] = instance.pk
+
+@csrf_exempt
+@require_POST
+def api_classifier(request):
+    """
+    Classification par lot pour les caméras et l'application mobile.
+    - multipart : fichiers `images` (+ `enregistrer=1` pour créer les ImageAnnotation)
+    - JSON : {"caracteristiques": [{"luminance_moyenne": .., "contraste": .., "taille_fichier": ..}, ...]}
+    Retourne pour chaque élément l'annotation automatique, les caractéristiques et le temps de traitement.
+    """
+    debut_requete = time.perf_counter()
+
+    if request.content_type == 'application/json':
+        try:
+            vecteurs = json.loads(request.body).get('caracteristiques')
+        except (ValueError, AttributeError):
+            return JsonResponse({'erreur': "Corps JSON invalide."}, status=400)
+        if not isinstance(vecteurs, list) or not vecteurs:
+            return JsonResponse({'erreur': "« caracteristiques » doit être une liste non vide."}, status=400)
+        if len(vecteurs) > settings.CLASSIFICATION_LOT_MAX_VECTEURS:
+            return JsonResponse({'erreur': f"Lot trop grand ({settings.CLASSIFICATION_LOT_MAX_VECTEURS} vecteurs max)."}, status=413)
+
+        elements = []
+        for vecteur in vecteurs:
+            if not isinstance(vecteur, dict):
+                vecteur = {}
+            caracteristiques = {}
+            for champ in ('luminance_moyenne', 'contraste', 'taille_fichier'):
+                valeur = vecteur.get(champ)
+                caracteristiques[champ] = float(valeur) if isinstance(valeur, (int, float)) else None
+            elements.append({'caracteristiques': caracteristiques, 'temps_ms': 0.0})
+    else:
+        fichiers = request.FILES.getlist('images')
+        if not fichiers:
+            return JsonResponse({'erreur': "Aucune image reçue (champ « images »)."}, status=400)
+        if len(fichiers) > settings.CLASSIFICATION_LOT_MAX_IMAGES:
+            return JsonResponse({'erreur': f"Lot trop grand ({settings.CLASSIFICATION_LOT_MAX_IMAGES} images max)."}, status=413)
+
+        elements = []
+        for fichier in fichiers:
+            element = {'nom': fichier.name, 'caracteristiques': {}, 'temps_ms': 0.0}
+            elements.append(element)
+            # Mêmes contrôles que ImageUploadForm.clean_image
+            if fichier.size > 10 * 1024 * 1024:
+                element['erreur'] = "L'image ne peut pas dépasser 10MB."
+                continue
+            if not fichier.name.lower().endswith(('.jpg', '.jpeg', '.png')):
+                element['erreur'] = "Seuls les formats JPG, JPEG et PNG sont acceptés."
+                continue
+            debut = time.perf_counter()
+            try:
+                element['caracteristiques'] = extraire_caracteristiques_image(fichier, fichier.size)
+                fichier.seek(0)
+                element['_fichier'] = fichier
+            except Exception as e:
+                element['erreur'] = f"Image illisible : {e}"
+            element['temps_ms'] = (time.perf_counter() - debut) * 1000
+
+    # Classification vectorisée de tout le lot, temps réparti entre les éléments
+    valides = [e for e in elements if 'erreur' not in e]
+    debut = time.perf_counter()
+    annotations = classifier_lot(
+        [e['caracteristiques'].get('luminance_moyenne') for e in valides],
+        [e['caracteristiques'].get('contraste') for e in valides],
+        [e['caracteristiques'].get('taille_fichier') for e in valides],
+    ) if valides else []
+    temps_classification = (time.perf_counter() - debut) * 1000 / max(len(valides), 1)
+    for element, annotation in zip(valides, annotations):
+        element['annotation_automatique'] = annotation
+        element['temps_ms'] += temps_classification
+
+    if request.POST.get('enregistrer') in ('1', 'true', 'oui'):
+        a_enregistrer = [e for e in valides if '_fichier' in e]
+        if a_enregistrer:
+            _enregistrer_lot(a_enregistrer)
+    for element in elements:
+        element.pop('_fichier', None)
+        element['temps_ms'] = round(element['temps_ms'], 2)
+
+    return JsonResponse({
+        'nombre': len(elements),
+        'resultats': elements,
+        'temps_total_ms': round((time.perf_counter() - debut_requete) * 1000, 2),
+    })
+
 def stats_plot(request):
     labels = ['Pleine', 'Vide', 'Non annotée']
     counts = [
@@ -263,7 +477,10 @@ def stats_plot(request):
     }
     filtered_colors = [color_map[label] for label in filtered_labels]
 
-    fig, ax = plt.subplots()
+    from matplotlib.figure import Figure
+
+    fig = Figure()
+    ax = fig.add_subplot()
     if sum(counts) == 0:
         ax.text(0.5, 0.5, 'Aucune donnée disponible', horizontalalignment='center', verticalalignment='center', fontsize=14, transform=ax.transAxes)
         ax.axis('off')
@@ -271,12 +488,13 @@ def stats_plot(request):
         ax.pie(filtered_counts, labels=filtered_labels, autopct='%1.1f%%', startangle=90, colors=filtered_colors)
         ax.axis('equal')
     buf = BytesIO()
-    plt.savefig(buf, format='png', bbox_inches='tight')
-    plt.close(fig)
+    fig.savefig(buf, format='png', bbox_inches='tight')
     buf.seek(0)
     return HttpResponse(buf.read(), content_type='image/png')
 
 def metrics_view(request):
+    from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
+
     # Récupérer les images annotées manuellement
     queryset = ImageAnnotation.objects.exclude(annotation='non_annotee')
     y_true = [img.annotation for img in queryset]
@@ -323,4 +541,38 @@ def metrics_view(request):
         }
     }
     
-    return render(request, 'interface/metrics.html', context)
\ No newline at end of file
+    return render(request, 'interface/metrics.html', context)
+
+def _stat_media(chemin):
+    try:
+        return os.stat(safe_join(settings.MEDIA_ROOT, chemin))
+    except (OSError, SuspiciousFileOperation):
+        return None
+
+def _etag_media(request, chemin):
+    stat = _stat_media(chemin)
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"' if stat else None
+
+def _date_media(request, chemin):
+    stat = _stat_media(chemin)
+    return datetime.fromtimestamp(stat.st_mtime, tz=dt_timezone.utc) if stat else None
+
+@require_safe
+@condition(etag_func=_etag_media, last_modified_func=_date_media)
+def servir_media(request, chemin):
+    """
+    Sert les fichiers de MEDIA_ROOT avec ETag / Last-Modified (réponses 304) et Cache-Control.
+    FileResponse passe par wsgi.file_wrapper, donc sendfile() sous gunicorn.
+    """
+    try:
+        chemin_complet = safe_join(settings.MEDIA_ROOT, chemin)
+    except SuspiciousFileOperation:
+        raise Http404("Chemin invalide")
+    if not os.path.isfile(chemin_complet):
+        raise Http404("Fichier introuvable")
+    content_type, encoding = mimetypes.guess_type(chemin_complet)
+    response = FileResponse(open(chemin_complet, 'rb'), content_type=content_type or 'application/octet-stream')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    patch_cache_control(response, public=True, max_age=settings.MEDIA_CACHE_MAX_AGE)
+    return response